@@ -0,0 +1,256 @@
+"""Кэш ответов API с инвалидацией по поколениям и условные запросы"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from recipes.cache import get_generations
+from recipes.models import Favorite, ShoppingCart
+from users.models import CustomUser, Subscription
+
+RESPONSE_KEY = 'api:response:{}'
+REPRESENTATION_KEY = 'api:recipe:{}:{}'
+
+# Заголовки-валидаторы, которые сохраняются вместе с данными ответа
+VALIDATORS = ('ETag', 'Last-Modified')
+
+
+def normalize_query(query_params):
+    """Параметры запроса в порядке, не зависящем от порядка
+    в адресе: ?tags=b&tags=a&limit=6 и ?limit=6&tags=a&tags=b
+    дают один и тот же ключ. Пустые значения отбрасываются"""
+    return '&'.join(
+        f'{name}={value}'
+        for name, values in sorted(query_params.lists())
+        for value in sorted(value for value in values if value)
+    )
+
+
+def response_cache_key(request, generations):
+    """Ключ ответа: поколения данных, схема и хост (они входят
+    в ссылки на страницы и изображения), путь и параметры"""
+    source = '|'.join((
+        ':'.join(map(str, generations)),
+        request.scheme,
+        request.get_host(),
+        request.path,
+        normalize_query(request.query_params),
+    ))
+    return RESPONSE_KEY.format(hashlib.md5(source.encode()).hexdigest())
+
+
+def representation_cache_key(request, recipe):
+    """Ключ общего представления рецепта: id, время изменения,
+    схема и хост (они входят в ссылки на изображения)"""
+    source = '|'.join((
+        request.scheme,
+        request.get_host(),
+        recipe.updated_at.isoformat(),
+    ))
+    return REPRESENTATION_KEY.format(
+        recipe.id, hashlib.md5(source.encode()).hexdigest()
+    )
+
+
+def cached_representations(request, recipes, render):
+    """Общие представления рецептов в порядке recipes. Найденные
+    берутся из кэша одним get_many, недостающие собирает render
+    по списку id, и они сохраняются одним set_many. Ключ меняется
+    вместе с updated_at, поэтому устаревшие записи не читаются.
+    Рецепты, удаленные до сборки, пропускаются"""
+    timeout = settings.RECIPE_CACHE_TIMEOUT
+    keys = {
+        recipe.id: representation_cache_key(request, recipe)
+        for recipe in recipes
+    }
+    found = cache.get_many(list(keys.values())) if timeout else {}
+    missing = [pk for pk, key in keys.items() if key not in found]
+    if missing:
+        rendered = {
+            keys[pk]: data for pk, data in render(missing).items()
+        }
+        if timeout:
+            cache.set_many(rendered, timeout)
+        found.update(rendered)
+    representations = (found.get(keys[recipe.id]) for recipe in recipes)
+    return [data for data in representations if data is not None]
+
+
+def make_etag(*parts):
+    """Сильный ETag из частей штампа версии"""
+    source = '|'.join(map(str, parts))
+    return quote_etag(hashlib.md5(source.encode()).hexdigest())
+
+
+def queryset_version(queryset):
+    """Штамп версии набора одним запросом: время последнего
+    изменения и число строк. Правка и добавление меняют время,
+    удаление - число строк"""
+    version = queryset.order_by().aggregate(
+        updated=Max('updated_at'),
+        count=Count('pk')
+    )
+    return version['updated'], version['count']
+
+
+def user_relations_version(user):
+    """Штамп личных флагов пользователя одним запросом: число и
+    наибольший id его записей в избранном, списке покупок и подписках.
+    id только растут, поэтому удаление меняет число, а добавление -
+    наибольший id"""
+    annotations = {}
+    for relation in (Favorite, ShoppingCart, Subscription):
+        rows = relation.objects.filter(
+            user=OuterRef('pk')
+        ).order_by().values('user')
+        name = relation._meta.model_name
+        annotations[f'{name}_count'] = Subquery(
+            rows.annotate(value=Count('pk')).values('value')
+        )
+        annotations[f'{name}_last'] = Subquery(
+            rows.annotate(value=Max('pk')).values('value')
+        )
+    return CustomUser.objects.filter(pk=user.pk).annotate(
+        **annotations
+    ).values_list(*annotations).first()
+
+
+def check_preconditions(request, validators):
+    """Ответ 304 (или 412 на If-Match) по заголовкам запроса
+    и валидаторам ответа, None - нужен полный ответ"""
+    last_modified = validators.get('Last-Modified')
+    response = get_conditional_response(
+        request,
+        etag=validators.get('ETag'),
+        last_modified=last_modified and parse_http_date_safe(last_modified)
+    )
+    if response is not None:
+        for name, value in validators.items():
+            response[name] = value
+    return response
+
+
+class ConditionalGetMixin:
+    """Условные запросы к list и retrieve. Сильный ETag и Last-Modified
+    строятся по штампу версии из get_version, а не по телу ответа,
+    поэтому на If-None-Match и If-Modified-Since ответ 304 отдается
+    до выборки страницы и работы сериализатора"""
+
+    def get_version_queryset(self):
+        """Набор для штампа версии: без аннотаций и подгрузки
+        связей, с фильтрами списка или одним объектом"""
+        queryset = self.get_queryset().model.objects.all()
+        if self.action == 'retrieve':
+            lookup = self.lookup_url_kwarg or self.lookup_field
+            return queryset.filter(
+                **{self.lookup_field: self.kwargs[lookup]}
+            )
+        return self.filter_queryset(queryset)
+
+    def get_version(self):
+        """Части штампа версии и время изменения для Last-Modified.
+        None отключает условные запросы для ответа. Для отсутствующего
+        объекта штампа нет, и retrieve отвечает 404 как обычно.
+        Удаление строки не меняет время последнего изменения списка,
+        поэтому Last-Modified отдается только для одного объекта,
+        а список проверяется по ETag, в который входит число строк"""
+        try:
+            updated, count = queryset_version(self.get_version_queryset())
+        except (TypeError, ValueError, ValidationError):
+            return None
+        if self.action == 'retrieve' and not count:
+            return None
+        if self.action != 'retrieve':
+            return (updated, count), None
+        return (updated, count), updated
+
+    def get_validators(self):
+        version = self.get_version()
+        if version is None:
+            return {}
+        parts, updated = version
+        validators = {'ETag': make_etag(*parts)}
+        if updated is not None:
+            validators['Last-Modified'] = http_date(updated.timestamp())
+        return validators
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        validators = self.get_validators()
+        not_modified = check_preconditions(request, validators)
+        if not_modified is not None:
+            return not_modified
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            for name, value in validators.items():
+                response[name] = value
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+
+class CachedResponseMixin:
+    """Кэширует данные ответов list и retrieve. Попадание в кэш
+    не обращается ни к базе данных, ни к сериализатору. Ключ включает
+    номера поколений из cache_generations, их увеличивают сигналы
+    при изменении моделей, поэтому изменения видны сразу.
+    При cache_anonymous_only кэшируются только ответы анонимным
+    пользователям: в ответах остальных есть их личные флаги.
+    Вместе с данными сохраняются валидаторы ConditionalGetMixin,
+    и попадание в кэш тоже отвечает 304 без обращения к базе"""
+    cache_generations = ()
+    cache_anonymous_only = False
+
+    def get_cache_generations(self):
+        return self.cache_generations
+
+    def is_cacheable(self, request):
+        return settings.RESPONSE_CACHE_TIMEOUT and not (
+            self.cache_anonymous_only and request.user.is_authenticated
+        )
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return handler(request, *args, **kwargs)
+        key = response_cache_key(
+            request, get_generations(*self.get_cache_generations())
+        )
+        cached = cache.get(key)
+        if cached is not None:
+            data, validators = cached
+            return check_preconditions(request, validators) or Response(
+                data, headers=validators
+            )
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            validators = {
+                name: response[name] for name in VALIDATORS
+                if response.has_header(name)
+            }
+            cache.set(
+                key,
+                (response.data, validators),
+                settings.RESPONSE_CACHE_TIMEOUT
+            )
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
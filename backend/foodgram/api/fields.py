@@ -0,0 +1,156 @@
+import base64
+import binascii
+import uuid
+from abc import ABC, abstractmethod
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from rest_framework import serializers
+
+BASE64_HEADER = ';base64,'
+BASE64_CHUNK_SIZE = 64 * 1024
+
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+
+def get_image_extension(header):
+    """Определяет формат изображения по первым байтам файла"""
+    for signature, extension in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return extension
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+class RawImageField(serializers.FileField):
+    """Изображение, которое сохраняется как есть: строка base64
+    из JSON или файл из multipart-запроса. Base64 декодируется
+    частями во временный файл, размер проверяется до декодирования.
+    Формат определяется только по сигнатуре файла, полное
+    декодирование и уменьшение выполняются в фоне"""
+    default_error_messages = {
+        'invalid_image': 'Загрузите корректное изображение.',
+        'invalid_type': 'Не удалось определить формат изображения.',
+        'too_large': 'Размер изображения превышает {max_size} МБ.',
+    }
+
+    def check_size(self, size):
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        if size > max_size:
+            self.fail('too_large', max_size=round(max_size / 1024 ** 2, 1))
+
+    def decode_base64(self, value):
+        """Декодирует строку base64 (с заголовком data: или без него)
+        в SpooledTemporaryFile, который переходит на диск при
+        превышении FILE_UPLOAD_MAX_MEMORY_SIZE"""
+        start = value.find(BASE64_HEADER, 0, 256)
+        start = 0 if start == -1 else start + len(BASE64_HEADER)
+        self.check_size((len(value) - start) * 3 // 4)
+        file = SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        )
+        rest = ''
+        for position in range(start, len(value), BASE64_CHUNK_SIZE):
+            chunk = rest + ''.join(
+                value[position:position + BASE64_CHUNK_SIZE].split()
+            )
+            complete = len(chunk) - len(chunk) % 4
+            try:
+                file.write(base64.b64decode(chunk[:complete], validate=True))
+            except (binascii.Error, ValueError):
+                file.close()
+                self.fail('invalid_image')
+            rest = chunk[complete:]
+        if rest:
+            file.close()
+            self.fail('invalid_image')
+        size = file.tell()
+        file.seek(0)
+        return UploadedFile(file=file, name='image', size=size)
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = self.decode_base64(data)
+        elif not hasattr(data, 'read'):
+            self.fail('invalid')
+        self.check_size(data.size)
+        extension = get_image_extension(data.read(12))
+        data.seek(0)
+        if extension is None:
+            self.fail('invalid_type')
+        data.name = f'{uuid.uuid4()}.{extension}'
+        return super().to_internal_value(data)
+
+
+class RecipeImageField(serializers.ImageField):
+    """Ссылка на уменьшенную копию изображения рецепта.
+    Если вариант не задан, в списке отдается копия для карточки,
+    на странице рецепта - полноразмерная"""
+
+    def __init__(self, variant=None, **kwargs):
+        self.variant = variant
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_variant(self):
+        if self.variant is not None:
+            return self.variant
+        view = self.context.get('view')
+        return 'card' if getattr(view, 'action', None) == 'list' else 'full'
+
+    def to_representation(self, recipe):
+        return super().to_representation(recipe.get_image(self.get_variant()))
+
+
+class RecipeImageVariantsField(serializers.Field, ABC):
+    """Базовое поле с готовыми копиями изображения рецепта.
+    Пока копии не готовы, поле возвращает None"""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_url(self, file):
+        request = self.context.get('request')
+        if request is None:
+            return file.url
+        return request.build_absolute_uri(file.url)
+
+    def to_representation(self, recipe):
+        variants = recipe.get_image_variants()
+        if not variants:
+            return None
+        return self.format(
+            (variant, self.get_url(file), width)
+            for variant, file, width in variants
+        )
+
+    @abstractmethod
+    def format(self, variants):
+        """Значение поля по кортежам (копия, ссылка, ширина)"""
+
+
+class RecipeImageSizesField(RecipeImageVariantsField):
+    """Ссылки на копии изображения и их ширина по названию копии"""
+
+    def format(self, variants):
+        return {
+            variant: {'url': url, 'width': width}
+            for variant, url, width in variants
+        }
+
+
+class RecipeImageSrcsetField(RecipeImageVariantsField):
+    """Значение атрибута srcset для тега img"""
+
+    def format(self, variants):
+        return ', '.join(f'{url} {width}w' for _, url, width in variants)
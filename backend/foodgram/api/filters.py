@@ -1,9 +1,10 @@
-from django.db.models import Q
-from django_filters import AllValuesMultipleFilter, BooleanFilter, FilterSet
+from django_filters import (BooleanFilter, ChoiceFilter, FilterSet,
+                            MultipleChoiceFilter)
 from django_filters.widgets import BooleanWidget
 from rest_framework.filters import SearchFilter
 
-from recipes.models import Recipe
+from recipes.cache import get_tag_choices, get_tag_map
+from recipes.models import Favorite, Recipe, RecipeTag, ShoppingCart
 
 
 class IngredientSearchFilter(SearchFilter):
@@ -12,7 +13,10 @@ class IngredientSearchFilter(SearchFilter):
 
 class RecipeFilterSet(FilterSet):
     """Фильтр для рецептов"""
-    tags = AllValuesMultipleFilter(field_name='tags__slug')
+    tags = MultipleChoiceFilter(
+        method='get_tags',
+        choices=get_tag_choices
+    )
     is_favorited = BooleanFilter(
         method='get_is_favorited',
         widget=BooleanWidget()
@@ -21,20 +25,48 @@ class RecipeFilterSet(FilterSet):
         method='get_is_in_shopping_cart',
         widget=BooleanWidget()
     )
+    ordering = ChoiceFilter(
+        method='get_ordering',
+        choices=(('-favorites_count', 'Сначала популярные'), )
+    )
+
+    def get_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        tag_map = get_tag_map()
+        return queryset.filter(id__in=RecipeTag.objects.filter(
+            tag_id__in=[tag_map[slug] for slug in value]
+        ).values('recipe_id'))
 
     def get_is_favorited(self, queryset, name, value):
-        user = self.request.user
-        if value and user.is_authenticated:
-            return queryset.filter(favorite__user=user)
-        return queryset.filter(~Q(favorite__user=user))
+        return self.filter_user_relation(queryset, name, Favorite, value)
 
     def get_is_in_shopping_cart(self, queryset, name, value):
+        return self.filter_user_relation(queryset, name, ShoppingCart, value)
+
+    def get_ordering(self, queryset, name, value):
+        """Сортировка по счетчику избранного, равные
+        значения упорядочиваются по убыванию id"""
+        return queryset.order_by(value, '-id')
+
+    def filter_user_relation(self, queryset, name, model, value):
+        """Фильтрует полусоединением с записями текущего пользователя:
+        id IN (...) или NOT IN (...) для value=False. Подзапрос не
+        зависит от строки рецепта и читает только записи пользователя,
+        поэтому не замедляется с ростом таблицы. Анонимный пользователь
+        ничего не добавлял, и подзапрос для него не нужен"""
         user = self.request.user
-        if value and user.is_authenticated:
-            return queryset.filter(shoppingcart__user=user)
-        return queryset.filter(~Q(shoppingcart__user=user))
+        if not user.is_authenticated:
+            return queryset.none() if value else queryset
+        recipe_ids = model.objects.filter(user=user).values('recipe_id')
+        if value:
+            return queryset.filter(id__in=recipe_ids)
+        return queryset.exclude(id__in=recipe_ids)
 
     class Meta:
         model = Recipe
-        fields = ['tags', 'author', 'is_favorited', 'is_in_shopping_cart', ]
+        fields = [
+            'tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+            'ordering',
+        ]
         ordering = ['id']
@@ -1,9 +1,13 @@
 """Вспомогательные функции, сокращающие код"""
+from django.db import transaction
+from django.db.models import Sum
 from django.shortcuts import get_object_or_404
 from rest_framework import status
 from rest_framework.response import Response
 
-from recipes.models import AmountOfIngredient, Ingredient, Recipe, RecipeTag
+from recipes.cache import bump_generations_on_commit
+from recipes.counters import RECIPE_COUNTERS, change_counter
+from recipes.models import AmountOfIngredient, Recipe, RecipeTag, ShoppingCart
 
 
 def extra_recipe(request, recipe_id, obj, serializer_short, message_exists,
@@ -12,30 +16,40 @@ def extra_recipe(request, recipe_id, obj, serializer_short, message_exists,
     shoping_cart и favorite"""
     user = request.user
     recipe = get_object_or_404(Recipe, id=recipe_id)
-    thing = obj.objects.filter(user=user, recipe=recipe)
+    counter = RECIPE_COUNTERS[obj]
     if request.method == 'POST':
-        if thing.exists():
+        with transaction.atomic():
+            _, created = obj.objects.get_or_create(user=user, recipe=recipe)
+            if created:
+                change_counter(Recipe, recipe.id, counter, 1)
+                bump_generations_on_commit('popularity')
+        if not created:
             return Response(
                 f"{message_exists}",
                 status=status.HTTP_400_BAD_REQUEST
             )
-        obj.objects.get_or_create(user=user, recipe=recipe)
         serializer = serializer_short(recipe)
         return Response(serializer.data, status=status.HTTP_200_OK)
-    if thing.exists():
-        thing.delete()
+    with transaction.atomic():
+        deleted, _ = obj.objects.filter(user=user, recipe=recipe).delete()
+        change_counter(Recipe, recipe.id, counter, -deleted)
+        if deleted:
+            bump_generations_on_commit('popularity')
+    if deleted:
         return Response(f"{message_del}", status=status.HTTP_200_OK)
     return Response(f"{message_no}", status=status.HTTP_400_BAD_REQUEST)
 
 
 def create_amout_of_ingredients(ingredients, recipe):
     """Вспомогательная функция для создание связи
-    между рецептом, его ингредиентами и их количеством"""
+    между рецептом, его ингредиентами и их количеством.
+    Объекты ингредиентов уже получены при валидации"""
     ingredients_in_recipe = [
-        AmountOfIngredient(recipe=recipe, ingredient=get_object_or_404(
-            Ingredient,
-            id=ingredient['id']
-        ), amount=ingredient['amount']) for ingredient in ingredients
+        AmountOfIngredient(
+            recipe=recipe,
+            ingredient=ingredient['ingredient'],
+            amount=ingredient['amount']
+        ) for ingredient in ingredients
     ]
     AmountOfIngredient.objects.bulk_create(ingredients_in_recipe)
 
@@ -43,10 +57,71 @@ def create_amout_of_ingredients(ingredients, recipe):
 def create_recipe_tag(tags, recipe):
     """Вспомогательная функция для создание связи
     между рецептом и его тэгами"""
-    for tag in tags:
-        RecipeTag.objects.bulk_create([
-            RecipeTag(
-                recipe=recipe,
-                tag=tag
-            )
-        ])
+    RecipeTag.objects.bulk_create([
+        RecipeTag(
+            recipe=recipe,
+            tag=tag
+        ) for tag in tags
+    ])
+
+
+def update_amount_of_ingredients(ingredients, recipe):
+    """Вспомогательная функция для обновления ингредиентов рецепта.
+    Сравнивает текущий и новый состав и выполняет не больше
+    одного удаления, одной вставки и одного обновления"""
+    existing = {
+        amount.ingredient_id: amount
+        for amount in recipe.amountofingredient.all()
+    }
+    incoming = {ingredient['id']: ingredient for ingredient in ingredients}
+    removed = [
+        amount.id for ingredient_id, amount in existing.items()
+        if ingredient_id not in incoming
+    ]
+    if removed:
+        AmountOfIngredient.objects.filter(id__in=removed).delete()
+    changed = []
+    for ingredient_id, amount in existing.items():
+        ingredient = incoming.get(ingredient_id)
+        if ingredient is not None and amount.amount != ingredient['amount']:
+            amount.amount = ingredient['amount']
+            changed.append(amount)
+    if changed:
+        AmountOfIngredient.objects.bulk_update(changed, ['amount'])
+    added = [
+        ingredient for ingredient in ingredients
+        if ingredient['id'] not in existing
+    ]
+    if added:
+        create_amout_of_ingredients(added, recipe)
+
+
+def update_recipe_tag(tags, recipe):
+    """Вспомогательная функция для обновления тэгов рецепта:
+    удаляет снятые тэги и добавляет новые"""
+    existing = {tag.id for tag in recipe.tags.all()}
+    incoming = {tag.id for tag in tags}
+    if existing - incoming:
+        RecipeTag.objects.filter(
+            recipe=recipe,
+            tag_id__in=existing - incoming
+        ).delete()
+    added = [tag for tag in tags if tag.id not in existing]
+    if added:
+        create_recipe_tag(added, recipe)
+
+
+def get_shopping_list(user):
+    """Вспомогательная функция, суммирующая ингредиенты
+    из списка покупок пользователя одним запросом"""
+    return AmountOfIngredient.objects.filter(
+        recipe__in=ShoppingCart.objects.filter(
+            user=user
+        ).values('recipe_id')
+    ).values(
+        'ingredient_id',
+        'ingredient__name',
+        'ingredient__measurement_unit',
+    ).annotate(
+        amount_of_ingredient=Sum('amount')
+    ).order_by('ingredient__name', 'ingredient_id')
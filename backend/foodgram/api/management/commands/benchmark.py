@@ -0,0 +1,316 @@
+import json
+import logging
+import re
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.error import HTTPError
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from users.models import CustomUser
+
+ENDPOINTS = {
+    'recipes-list': ('/api/recipes/?limit=6', False),
+    'recipes-list-50': ('/api/recipes/?limit=50', False),
+    'recipes-detail': ('/api/recipes/{recipe}/', False),
+    'recipes-tags': ('/api/recipes/?tags={tag}&limit=6', False),
+    'recipes-author': ('/api/recipes/?author={author}&limit=6', False),
+    'recipes-favorited': ('/api/recipes/?is_favorited=1&limit=6', True),
+    'recipes-not-favorited': ('/api/recipes/?is_favorited=0&limit=6', True),
+    'recipes-in-cart': (
+        '/api/recipes/?is_in_shopping_cart=1&limit=6', True
+    ),
+    'recipes-not-in-cart': (
+        '/api/recipes/?is_in_shopping_cart=0&limit=6', True
+    ),
+    'recipes-popular': (
+        '/api/recipes/?ordering=-favorites_count&limit=6', False
+    ),
+    'tags': ('/api/tags/', False),
+    'ingredients': ('/api/ingredients/?name={ingredient}', False),
+    'users-list': ('/api/users/?limit=6', False),
+    'users-me': ('/api/users/me/', True),
+    'subscriptions': ('/api/users/subscriptions/?limit=6', True),
+    'download-shopping-cart': (
+        '/api/recipes/download_shopping_cart/', True
+    ),
+}
+
+# Наборы маршрутов для --scenario
+SCENARIOS = {
+    # Время фильтров не должно зависеть от размера таблиц избранного
+    # и списков покупок. Прогоны с --user synthetic0 сравниваются
+    # через --compare на базах, созданных generate_data --skew 0
+    # --users 1000 --favorites 10000 --cart-items 10000 и --skew 0
+    # --users 100000 --favorites 1000000 --cart-items 1000000:
+    # у пользователя в обеих около десяти записей каждой связи
+    'relation-filters': (
+        'recipes-favorited',
+        'recipes-not-favorited',
+        'recipes-in-cart',
+        'recipes-not-in-cart',
+    ),
+}
+
+QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def percentile(values, percent):
+    """Перцентиль по ближайшему рангу для отсортированного списка"""
+    rank = max(0, -(-len(values) * percent // 100) - 1)
+    return values[int(rank)]
+
+
+def summarize(timings, statuses, queries, elapsed):
+    timings = sorted(timings)
+    queries = sorted(queries)
+    return {
+        'requests': len(timings),
+        'errors': sum(status >= 400 for status in statuses),
+        'p50_ms': round(percentile(timings, 50) * 1000, 2),
+        'p95_ms': round(percentile(timings, 95) * 1000, 2),
+        'p99_ms': round(percentile(timings, 99) * 1000, 2),
+        'mean_ms': round(sum(timings) / len(timings) * 1000, 2),
+        'rps': round(len(timings) / max(elapsed, 1e-9), 1),
+        'queries': percentile(queries, 50) if queries else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class InProcessClient:
+    """Запросы проходят через все промежуточные слои и маршруты
+    Django в текущем процессе, без сети. Лог метрик и превышений
+    бюджета отключается: число запросов и так есть в отчете"""
+    mode = 'in-process'
+
+    def __init__(self, token):
+        logging.getLogger('api.middleware').setLevel(logging.ERROR)
+        override_settings(SERVER_TIMING=True).enable()
+        self.client = Client(HTTP_HOST='localhost')
+        self.token = token
+
+    def get(self, path, auth):
+        headers = {}
+        if auth:
+            headers['HTTP_AUTHORIZATION'] = f'Token {self.token}'
+        response = self.client.get(path, **headers)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response.status_code, response.get('Server-Timing', '')
+
+
+class HTTPClient:
+    """Запросы к запущенному серверу, например
+    manage.py runserver или gunicorn. Число SQL-запросов
+    известно, только если на сервере SERVER_TIMING = True"""
+    mode = 'http'
+
+    def __init__(self, token, url):
+        self.token = token
+        self.url = url.rstrip('/')
+
+    def get(self, path, auth):
+        request = Request(self.url + path)
+        if auth:
+            request.add_header('Authorization', f'Token {self.token}')
+        try:
+            with urlopen(request) as response:
+                response.read()
+                return response.status, response.headers.get(
+                    'Server-Timing', ''
+                )
+        except HTTPError as error:
+            error.read()
+            return error.code, error.headers.get('Server-Timing', '')
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный прогон основных маршрутов API: p50/p95/p99, '
+        'запросы в секунду и число SQL-запросов по каждому маршруту. '
+        'Результат сохраняется в JSON для сравнения между коммитами'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            help=(
+                'Адрес запущенного сервера, например http://localhost:8000. '
+                'Без него запросы выполняются в текущем процессе'
+            )
+        )
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=1,
+            help='Количество одновременных запросов при --url'
+        )
+        parser.add_argument(
+            '--endpoints',
+            nargs='+',
+            choices=ENDPOINTS,
+            default=list(ENDPOINTS),
+        )
+        parser.add_argument(
+            '--scenario',
+            choices=SCENARIOS,
+            help='Набор маршрутов вместо --endpoints'
+        )
+        parser.add_argument(
+            '--user',
+            help=(
+                'Имя пользователя для запросов с авторизацией, '
+                'по умолчанию - первый пользователь'
+            )
+        )
+        parser.add_argument('--label', help='Метка прогона в JSON')
+        parser.add_argument('--output', help='Файл для сохранения результата')
+        parser.add_argument(
+            '--compare',
+            help='JSON предыдущего прогона для сравнения'
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError(
+                'Количество запросов и одновременных запросов '
+                'должно быть положительным'
+            )
+        if options['concurrency'] > 1 and not options['url']:
+            raise CommandError('--concurrency работает только с --url')
+        user, params = self.get_params(options['user'])
+        token, _ = Token.objects.get_or_create(user=user)
+        if options['url']:
+            client = HTTPClient(token.key, options['url'])
+        else:
+            client = InProcessClient(token.key)
+
+        endpoints = options['endpoints']
+        if options['scenario']:
+            endpoints = SCENARIOS[options['scenario']]
+        results = {}
+        for name in endpoints:
+            template, auth = ENDPOINTS[name]
+            results[name] = self.run_endpoint(
+                client, template.format(**params), auth, options
+            )
+            self.print_result(name, results[name])
+        report = {
+            'label': options['label'],
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'commit': git_commit(),
+            'database': connection.vendor,
+            'mode': client.mode,
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'scenario': options['scenario'],
+            'data': {
+                'recipes': Recipe.objects.count(),
+                'favorites': Favorite.objects.count(),
+                'cart_items': ShoppingCart.objects.count(),
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    @staticmethod
+    def get_params(username):
+        """Пользователь и значения для подстановки в маршруты"""
+        users = CustomUser.objects.order_by('id')
+        user = users.filter(username=username).first() if username else (
+            users.first()
+        )
+        recipe = Recipe.objects.order_by('id').first()
+        tag = Tag.objects.order_by('id').first()
+        ingredient = Ingredient.objects.order_by('id').first()
+        if None in (user, recipe, tag, ingredient):
+            raise CommandError(
+                'Нет данных для прогона, создайте их командой generate_data'
+            )
+        return user, {
+            'recipe': recipe.id,
+            'tag': tag.slug,
+            'author': recipe.author_id,
+            'ingredient': quote(ingredient.name[:3]),
+        }
+
+    def run_endpoint(self, client, path, auth, options):
+        for _ in range(options['warmup']):
+            client.get(path, auth)
+
+        def timed(_):
+            started = time.perf_counter()
+            status, server_timing = client.get(path, auth)
+            return time.perf_counter() - started, status, server_timing
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            samples = list(pool.map(timed, range(options['requests'])))
+        elapsed = time.perf_counter() - started
+        timings, statuses, server_timings = zip(*samples)
+        queries = [
+            int(match.group(1)) for match in map(
+                QUERIES.search, server_timings
+            ) if match
+        ]
+        return dict(
+            summarize(timings, statuses, queries, elapsed), path=path
+        )
+
+    def print_result(self, name, result):
+        line = (
+            f'{name:<24} p50 {result["p50_ms"]:>8.2f} мс  '
+            f'p95 {result["p95_ms"]:>8.2f} мс  '
+            f'p99 {result["p99_ms"]:>8.2f} мс  '
+            f'{result["rps"]:>8.1f} запр/с  '
+            f'SQL {result["queries"]}'
+        )
+        if result['errors']:
+            self.stdout.write(self.style.ERROR(
+                f'{line}  ошибок: {result["errors"]}'
+            ))
+        else:
+            self.stdout.write(line)
+
+    def compare(self, path, results):
+        with open(path, encoding='utf-8') as file:
+            previous = json.load(file)
+        self.stdout.write(
+            f'Сравнение с {previous.get("label") or previous.get("commit")}:'
+        )
+        for name, result in results.items():
+            before = previous['results'].get(name)
+            if before is None:
+                continue
+            changes = '  '.join(
+                f'{key} {before[key]:.2f} -> {result[key]:.2f} '
+                f'({(result[key] / before[key] - 1) * 100:+.0f}%)'
+                for key in ('p50_ms', 'p95_ms')
+                if before[key]
+            )
+            self.stdout.write(f'{name:<24} {changes}')
@@ -0,0 +1,178 @@
+import re
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.help_functions import get_shopping_list
+from recipes.models import (AmountOfIngredient, Favorite, Ingredient, Recipe,
+                            RecipeTag, ShoppingCart)
+from users.models import CustomUser, Subscription
+
+LARGE_TABLES = (
+    'recipes_recipe',
+    'recipes_favorite',
+    'recipes_shoppingcart',
+    'recipes_amountofingredient',
+    'recipes_recipetag',
+    'users_subscription',
+)
+
+SEQUENTIAL_SCAN = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'\bSCAN (?:TABLE )?(\w+)\b(?!\s+USING)'),
+}
+
+
+def query_shapes(user):
+    """Запросы, которые выполняет API, в том виде,
+    в каком их строят вьюсеты и сериализаторы.
+    Третий элемент - таблицы, которые запрос читает по порядку
+    первичного ключа до LIMIT, такой проход не считается ошибкой"""
+    recipes = Recipe.objects.with_user_flags(user)
+    page = slice(0, 6)
+    recipe_ids = [1, 2, 3, 4, 5, 6]
+    favorites = Favorite.objects.filter(user=user).values('recipe_id')
+    return (
+        ('recipes:list', recipes[page], ('recipes_recipe', )),
+        ('recipes:detail', recipes.filter(id=1), ()),
+        (
+            'recipes:tags',
+            recipes.filter(id__in=RecipeTag.objects.filter(
+                tag_id__in=[1]
+            ).values('recipe_id'))[page],
+            ()
+        ),
+        ('recipes:author', recipes.filter(author=user)[page], ()),
+        (
+            'recipes:popular',
+            recipes.order_by('-favorites_count', '-id')[page],
+            ()
+        ),
+        (
+            'recipes:favorited',
+            recipes.filter(id__in=favorites)[page],
+            ()
+        ),
+        (
+            'recipes:not_favorited',
+            recipes.exclude(id__in=favorites)[page],
+            ('recipes_recipe', )
+        ),
+        (
+            'recipes:in_shopping_cart',
+            recipes.filter(id__in=ShoppingCart.objects.filter(
+                user=user
+            ).values('recipe_id'))[page],
+            ()
+        ),
+        (
+            'recipes:prefetch_ingredients',
+            AmountOfIngredient.objects.filter(
+                recipe__in=recipe_ids
+            ).select_related('ingredient'),
+            ()
+        ),
+        (
+            'recipes:prefetch_tags',
+            RecipeTag.objects.filter(
+                recipe__in=recipe_ids
+            ).select_related('tag'),
+            ()
+        ),
+        (
+            'favorite:exists',
+            Favorite.objects.filter(user=user, recipe_id=1),
+            ()
+        ),
+        (
+            'shopping_cart:exists',
+            ShoppingCart.objects.filter(user=user, recipe_id=1),
+            ()
+        ),
+        ('shopping_cart:download', get_shopping_list(user), ()),
+        (
+            'subscriptions:list',
+            Subscription.objects.filter(user=user)[page],
+            ()
+        ),
+        (
+            'subscriptions:latest_recipes',
+            Recipe.objects.latest_per_author([user.id], 3),
+            ()
+        ),
+        (
+            'subscriptions:exists',
+            Subscription.objects.filter(user=user, author_id=1),
+            ()
+        ),
+        (
+            'ingredients:prefix',
+            Ingredient.objects.filter(name__startswith='мол'),
+            ()
+        ),
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет EXPLAIN для каждого запроса API и завершается с ошибкой, '
+        'если в плане есть последовательное чтение большой таблицы'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tables',
+            nargs='+',
+            default=LARGE_TABLES,
+            help='Таблицы, которые нельзя читать последовательно'
+        )
+        parser.add_argument(
+            '--planner-defaults',
+            action='store_true',
+            help=(
+                'Не отключать seqscan в PostgreSQL. По умолчанию он '
+                'отключается, чтобы проверка не зависела от объема данных'
+            )
+        )
+        parser.add_argument(
+            '--verbose-plans',
+            action='store_true',
+            help='Печатать планы всех запросов'
+        )
+
+    def handle(self, *args, **options):
+        pattern = SEQUENTIAL_SCAN.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(
+                f'EXPLAIN для {connection.vendor} не поддерживается'
+            )
+        user = CustomUser.objects.order_by('id').first() or CustomUser(id=0)
+        failures = []
+        with transaction.atomic():
+            if (
+                connection.vendor == 'postgresql'
+                and not options['planner_defaults']
+            ):
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            for name, queryset, ordered in query_shapes(user):
+                plan = queryset.explain()
+                scanned = {
+                    table for table in pattern.findall(plan)
+                    if table in options['tables'] and table not in ordered
+                }
+                if options['verbose_plans'] or scanned:
+                    self.stdout.write(f'{name}\n{plan}\n')
+                if scanned:
+                    failures.append(f'{name}: {", ".join(sorted(scanned))}')
+                    self.stdout.write(self.style.ERROR(
+                        f'{name}: последовательное чтение '
+                        f'{", ".join(sorted(scanned))}'
+                    ))
+                else:
+                    self.stdout.write(self.style.SUCCESS(f'{name}: OK'))
+        if failures:
+            raise CommandError(
+                'Последовательное чтение больших таблиц: '
+                + '; '.join(failures)
+            )
@@ -0,0 +1,161 @@
+"""Метрики запросов: количество и время SQL-запросов,
+время сериализации и размер ответа"""
+import json
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+current_metrics = ContextVar('request_metrics', default=None)
+
+
+class QueryBudgetError(Exception):
+    """Представление выполнило больше SQL-запросов,
+    чем разрешено в QUERY_BUDGETS"""
+
+
+class RequestMetrics:
+    """Счетчики одного запроса. Экземпляр передается
+    в connection.execute_wrapper и учитывает каждый SQL-запрос"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += elapsed
+            if elapsed * 1000 >= settings.SLOW_QUERY_MS:
+                logger.warning(
+                    'Медленный запрос (%.1f мс): %s', elapsed * 1000, sql
+                )
+
+
+class SerializerMetricsMixin:
+    """Миксин представления DRF: время от создания первого
+    сериализатора до finalize_response за вычетом SQL-запросов
+    учитывается как время сериализации. Для изменяющих запросов
+    в него входят проверка данных и сохранение"""
+    serializer_started = None
+
+    def get_serializer(self, *args, **kwargs):
+        metrics = current_metrics.get()
+        if metrics is not None and self.serializer_started is None:
+            self.serializer_started = (time.perf_counter(), metrics.db_time)
+        return super().get_serializer(*args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        metrics = current_metrics.get()
+        if metrics is not None and self.serializer_started is not None:
+            started, db_time = self.serializer_started
+            metrics.serializer_time += (
+                time.perf_counter() - started
+                - (metrics.db_time - db_time)
+            )
+            self.serializer_started = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+@contextmanager
+def count_queries(metrics):
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(metrics))
+        yield
+
+
+class QueryMetricsMiddleware:
+    """Считает SQL-запросы, время работы с базой, время сериализации
+    (в представлениях с SerializerMetricsMixin) и размер ответа.
+    При SERVER_TIMING = True результат отдается в заголовке
+    Server-Timing, а в лог с уровнем DEBUG пишется одной JSON-строкой.
+    Если представление выполнило больше запросов, чем указано для
+    него в QUERY_BUDGETS (ключ - имя URL, для отдельного метода -
+    'POST имя'), пишется предупреждение, а при QUERY_BUDGET_RAISE =
+    True выбрасывается QueryBudgetError. Запросы потоковых ответов
+    учитываются после отправки последней части"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        started = time.perf_counter()
+        try:
+            with count_queries(metrics):
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = self.server_timing(
+                metrics, time.perf_counter() - started
+            )
+        if response.streaming:
+            response.streaming_content = self.stream(
+                request, response, response.streaming_content, metrics, started
+            )
+        else:
+            self.finish(
+                request, response, metrics, started, len(response.content)
+            )
+        return response
+
+    def stream(self, request, response, content, metrics, started):
+        size = 0
+        with count_queries(metrics):
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        self.finish(request, response, metrics, started, size)
+
+    @staticmethod
+    def server_timing(metrics, total):
+        return (
+            f'db;dur={metrics.db_time * 1000:.1f};'
+            f'desc="{metrics.queries} queries", '
+            f'serializer;dur={metrics.serializer_time * 1000:.1f}, '
+            f'total;dur={total * 1000:.1f}'
+        )
+
+    @staticmethod
+    def finish(request, response, metrics, started, size):
+        view_name = getattr(request.resolver_match, 'view_name', None)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'view': view_name,
+                'status': response.status_code,
+                'queries': metrics.queries,
+                'db_ms': round(metrics.db_time * 1000, 1),
+                'serializer_ms': round(metrics.serializer_time * 1000, 1),
+                'total_ms': round((time.perf_counter() - started) * 1000, 1),
+                'size': size,
+            }, ensure_ascii=False))
+        budget = settings.QUERY_BUDGETS.get(
+            f'{request.method} {view_name}',
+            settings.QUERY_BUDGETS.get(
+                view_name, settings.DEFAULT_QUERY_BUDGET
+            )
+        )
+        if budget is None or metrics.queries <= budget:
+            return
+        message = (
+            f'{view_name}: выполнено {metrics.queries} SQL-запросов '
+            f'при бюджете {budget}'
+        )
+        if settings.QUERY_BUDGET_RAISE:
+            raise QueryBudgetError(message)
+        logger.warning(message)
@@ -1,6 +1,62 @@
-from rest_framework.pagination import PageNumberPagination
+from django.core.paginator import Paginator
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class PrimaryKeyCountPaginator(Paginator):
+    """Считает строки запросом только по первичному ключу, чтобы
+    COUNT(*) не вычислял аннотации вроде is_favorited для каждой строки"""
+
+    @cached_property
+    def count(self):
+        if isinstance(self.object_list, QuerySet):
+            return self.object_list.values('pk').count()
+        return super().count
+
+
+class LimitCursorPagination(CursorPagination):
+    """Курсорная пагинация без OFFSET и без COUNT(*): страница
+    выбирается условием по первому полю сортировки. Порядок тот же,
+    что у постраничной пагинации: сортировка queryset, например
+    ?ordering=-favorites_count, иначе сортировка модели, то есть
+    по возрастанию id"""
+    page_size = 6
+    page_size_query_param = 'limit'
+    ordering = 'id'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = (
+            queryset.query.order_by or queryset.model._meta.ordering
+        )
+        if ordering and all(isinstance(field, str) for field in ordering):
+            return tuple(ordering)
+        return super().get_ordering(request, queryset, view)
 
 
 class LimitPageNumberPagination(PageNumberPagination):
+    """Пагинация page/limit. При ?pagination=cursor или переданном
+    cursor переключается на курсорную пагинацию"""
     page_size = 6
     page_size_query_param = 'limit'
+    django_paginator_class = PrimaryKeyCountPaginator
+    cursor_pagination_class = LimitCursorPagination
+    cursor_mode_query_param = 'pagination'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if (
+            request.query_params.get(self.cursor_mode_query_param) == 'cursor'
+            or self.cursor_pagination_class.cursor_query_param
+            in request.query_params
+        ):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
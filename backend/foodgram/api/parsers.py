@@ -0,0 +1,25 @@
+import json
+
+from django.utils.datastructures import MultiValueDict
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+
+class MultiPartJSONParser(MultiPartParser):
+    """Multipart-запрос, в котором поля рецепта переданы JSON-объектом
+    в части data, а изображение - отдельным файлом. Файл принимается
+    обработчиками загрузки Django и крупные файлы пишутся
+    на диск по частям, не попадая в память целиком"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        result = super().parse(stream, media_type, parser_context)
+        if 'data' not in result.data:
+            return result
+        try:
+            data = json.loads(result.data['data'])
+        except ValueError as error:
+            raise ParseError(f'Некорректный JSON в поле data: {error}')
+        if not isinstance(data, dict):
+            raise ParseError('Поле data должно содержать объект JSON')
+        data.update(result.files.dict())
+        return DataAndFiles(data, MultiValueDict())
@@ -0,0 +1,124 @@
+"""Рендереры потоковой выгрузки списка покупок"""
+import csv
+import os
+from abc import ABC, abstractmethod
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.renderers import BaseRenderer
+
+CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_SIZE = 1024 * 1024
+PDF_FONT = 'DejaVuSerif'
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+
+
+class Echo:
+    """Буфер, возвращающий записанную строку,
+    чтобы csv.writer отдавал строки по одной"""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListRenderer(BaseRenderer, ABC):
+    """Базовый рендерер списка покупок.
+    Метод stream превращает итератор строк списка
+    в генератор байтов для StreamingHttpResponse"""
+    charset = 'utf-8'
+
+    @abstractmethod
+    def stream(self, items):
+        """Генератор байтов выгрузки по итератору строк списка"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Используется только для ответов с ошибками: они отдаются
+        обычным текстом, а не с типом выгрузки вроде application/pdf"""
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = 'text/plain; charset=utf-8'
+        if isinstance(data, dict):
+            data = '\n'.join(f'{key}: {value}' for key, value in data.items())
+        return str(data).encode('utf-8')
+
+    @staticmethod
+    def line(item):
+        return (
+            item['ingredient__name'],
+            item['ingredient__measurement_unit'],
+            item['amount_of_ingredient'],
+        )
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    """Список покупок обычным текстом"""
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, items):
+        for item in items:
+            name, measurement_unit, amount = self.line(item)
+            yield f'{name} ({measurement_unit}) - {amount}\n'.encode(
+                self.charset
+            )
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    """Список покупок в формате CSV"""
+    media_type = 'text/csv'
+    format = 'csv'
+    header = ('Ингредиент', 'Единица измерения', 'Количество')
+
+    def stream(self, items):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.header).encode(self.charset)
+        for item in items:
+            yield writer.writerow(self.line(item)).encode(self.charset)
+
+
+class PDFShoppingListRenderer(ShoppingListRenderer):
+    """Список покупок в формате PDF, разбитый на страницы.
+    Страницы рисуются по мере чтения строк, готовый документ
+    копится во временном файле и отдается частями"""
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+    def stream(self, items):
+        if PDF_FONT not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(TTFont(
+                PDF_FONT,
+                os.path.join(settings.BASE_DIR, 'fonts', f'{PDF_FONT}.ttf')
+            ))
+        _, height = A4
+        line_height = PDF_FONT_SIZE * 1.5
+        with SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as file:
+            document = canvas.Canvas(file, pagesize=A4)
+            document.setFont(PDF_FONT, PDF_FONT_SIZE)
+            y = height - PDF_MARGIN
+            for item in items:
+                if y < PDF_MARGIN:
+                    document.showPage()
+                    document.setFont(PDF_FONT, PDF_FONT_SIZE)
+                    y = height - PDF_MARGIN
+                name, measurement_unit, amount = self.line(item)
+                document.drawString(
+                    PDF_MARGIN, y, f'{name} ({measurement_unit}) - {amount}'
+                )
+                y -= line_height
+            document.save()
+            file.seek(0)
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+                yield chunk
+
+
+SHOPPING_LIST_RENDERERS = (
+    TextShoppingListRenderer,
+    CSVShoppingListRenderer,
+    PDFShoppingListRenderer,
+)
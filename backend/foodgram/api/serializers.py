@@ -1,17 +1,29 @@
-from drf_extra_fields.fields import Base64ImageField
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
 from rest_framework import serializers
 
+from recipes.counters import change_counter
 from recipes.models import (AmountOfIngredient, Favorite, Ingredient, Recipe,
                             ShoppingCart, Tag)
+from users.models import CustomUser, Subscription
 from users.serializers import CustomUserSerializer
-from .help_functions import create_amout_of_ingredients, create_recipe_tag
+from .cache import cached_representations
+from .fields import (RawImageField, RecipeImageField, RecipeImageSizesField,
+                     RecipeImageSrcsetField)
+from .help_functions import (create_amout_of_ingredients, create_recipe_tag,
+                             update_amount_of_ingredients, update_recipe_tag)
 
 
 class TagSerializer(serializers.ModelSerializer):
     """Сериализатор создания и показа списка тэгов"""
 
     class Meta:
-        fields = '__all__'
+        fields = (
+            'id',
+            'name',
+            'color',
+            'slug'
+        )
         model = Tag
 
         extra_kwargs = {
@@ -56,6 +68,55 @@ class IngredientShowSerializer(serializers.ModelSerializer):
         )
 
 
+class RecipeListSerializer(serializers.ListSerializer):
+    """Список рецептов в два слоя. Общее для всех представление
+    рецепта берется из кэша по id и updated_at, а флаги текущего
+    пользователя вычисляются для всей страницы тремя запросами
+    и накладываются поверх. У рецептов страницы достаточно
+    полей id, author и updated_at"""
+
+    def render_shared(self, ids):
+        """Представления рецептов с флагами анонимного пользователя"""
+        recipes = Recipe.objects.filter(id__in=ids).with_related(
+        ).with_user_flags(AnonymousUser())
+        return {
+            recipe.id: self.child.to_representation(recipe)
+            for recipe in recipes
+        }
+
+    def overlay_user_flags(self, representations, user):
+        recipe_ids = [recipe['id'] for recipe in representations]
+        favorited = set(Favorite.objects.filter(
+            user=user,
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', flat=True))
+        in_shopping_cart = set(ShoppingCart.objects.filter(
+            user=user,
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', flat=True))
+        subscribed = set(Subscription.objects.filter(
+            user=user,
+            author_id__in={
+                recipe['author']['id'] for recipe in representations
+            }
+        ).values_list('author_id', flat=True))
+        for recipe in representations:
+            recipe['is_favorited'] = recipe['id'] in favorited
+            recipe['is_in_shopping_cart'] = recipe['id'] in in_shopping_cart
+            recipe['author']['is_subscribed'] = (
+                recipe['author']['id'] in subscribed
+            )
+
+    def to_representation(self, data):
+        request = self.context['request']
+        representations = cached_representations(
+            request, list(data), self.render_shared
+        )
+        if representations and request.user.is_authenticated:
+            self.overlay_user_flags(representations, request.user)
+        return representations
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """Сериализатор показа списка рецептов"""
     author = CustomUserSerializer(read_only=True)
@@ -67,8 +128,13 @@ class RecipeSerializer(serializers.ModelSerializer):
     tags = TagSerializer(read_only=True, many=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image = RecipeImageField()
+    image_sizes = RecipeImageSizesField()
+    image_srcset = RecipeImageSrcsetField()
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request_user = self.context.get('request').user.id
         return Favorite.objects.filter(
             recipe=obj.id,
@@ -76,14 +142,22 @@ class RecipeSerializer(serializers.ModelSerializer):
         ).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request_user = self.context.get('request').user.id
         return ShoppingCart.objects.filter(
             recipe=obj.id,
             user=request_user
         ).exists()
 
+    def to_representation(self, instance):
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
+
     class Meta:
         model = Recipe
+        list_serializer_class = RecipeListSerializer
         fields = (
             'id',
             'tags',
@@ -93,6 +167,8 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_sizes',
+            'image_srcset',
             'text',
             'cooking_time',
         )
@@ -105,8 +181,9 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         queryset=Tag.objects.all(),
         many=True,
     )
-    image = Base64ImageField(use_url=True, )
+    image = RawImageField(use_url=True, )
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
@@ -116,27 +193,30 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         )
         create_amout_of_ingredients(ingredients, recipe)
         create_recipe_tag(tags, recipe)
+        change_counter(CustomUser, recipe.author_id, 'recipes_count', 1)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients', None)
         tags = validated_data.pop('tags', None)
         recipe = instance
 
         if ingredients is not None:
-            instance.amountofingredient.all().delete()
-            create_amout_of_ingredients(ingredients, recipe)
+            update_amount_of_ingredients(ingredients, recipe)
 
         if tags is not None:
-            instance.recipetag.all().delete()
-            create_recipe_tag(tags, recipe)
+            update_recipe_tag(tags, recipe)
+
+        if 'image' in validated_data:
+            validated_data['image_status'] = Recipe.IMAGE_PENDING
 
         return super(
             RecipeCreateSerializer, self
         ).update(instance, validated_data)
 
     def validate(self, data):
-        ingredients = data['ingredients']
+        ingredients = data.get('ingredients', [])
         id_of_input_ingredients = []
         for ingredient in ingredients:
             if ingredient['id'] in id_of_input_ingredients:
@@ -148,8 +228,24 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                     {'amount': ('Некорректное количество ингредиента')}
                 )
             id_of_input_ingredients.append(ingredient['id'])
+        existing_ingredients = Ingredient.objects.in_bulk(
+            id_of_input_ingredients
+        )
+        missing_ingredients = [
+            ingredient_id for ingredient_id in id_of_input_ingredients
+            if ingredient_id not in existing_ingredients
+        ]
+        if missing_ingredients:
+            raise serializers.ValidationError(
+                {'ingredients': (
+                    'Ингредиенты не найдены: '
+                    f'{", ".join(map(str, missing_ingredients))}'
+                )}
+            )
+        for ingredient in ingredients:
+            ingredient['ingredient'] = existing_ingredients[ingredient['id']]
 
-        tags = data['tags']
+        tags = data.get('tags', [])
         input_tags = []
         for tag in tags:
             if tag in input_tags:
@@ -160,8 +256,11 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         return data
 
     def to_representation(self, value):
+        recipe = Recipe.objects.with_related().with_user_flags(
+            self.context['request'].user
+        ).get(pk=value.pk)
         return RecipeSerializer(
-            value,
+            recipe,
             context=self.context
         ).data
 
@@ -181,6 +280,9 @@ class ShortViewOfRecipe(serializers.ModelSerializer):
     """Сериализатор показа рецептов
     при добавлении в избранное и список
     покупок"""
+    image = RecipeImageField(variant='thumbnail')
+    image_sizes = RecipeImageSizesField()
+    image_srcset = RecipeImageSrcsetField()
 
     class Meta:
         model = Recipe
@@ -188,5 +290,7 @@ class ShortViewOfRecipe(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_sizes',
+            'image_srcset',
             'cooking_time',
         )
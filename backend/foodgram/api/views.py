@@ -1,46 +1,120 @@
-from io import StringIO
-
-from django.db.models import Sum
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
 from django_filters.rest_framework import DjangoFilterBackend
-from recipes.models import (AmountOfIngredient, Favorite, Ingredient, Recipe,
-                            ShoppingCart, Tag)
+from recipes.counters import change_counter
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from recipes.search import ingredient_index
 from rest_framework import viewsets
-from rest_framework.decorators import api_view
-
+from rest_framework.decorators import (api_view, permission_classes,
+                                       renderer_classes)
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from users.models import CustomUser
+
+from .cache import (CachedResponseMixin, ConditionalGetMixin,
+                    user_relations_version)
 from .filters import IngredientSearchFilter, RecipeFilterSet
-from .help_functions import extra_recipe
+from .help_functions import extra_recipe, get_shopping_list
+from .middleware import SerializerMetricsMixin
 from .pagination import LimitPageNumberPagination
+from .parsers import MultiPartJSONParser
 from .permissions import IsAuthorOrReadOnly
+from .renderers import SHOPPING_LIST_RENDERERS
 from .serializers import (IngredientSerializer, RecipeCreateSerializer,
                           RecipeSerializer, ShortViewOfRecipe, TagSerializer)
 from .viewsets import ReadViewSet
 
 
-class IngredientViewSet(ReadViewSet):
+class IngredientViewSet(CachedResponseMixin, ConditionalGetMixin,
+                        ReadViewSet):
     """Вьюсет модели Ингредиент"""
     serializer_class = IngredientSerializer
     queryset = Ingredient.objects.all()
     pagination_class = None
+    cache_generations = ('ingredients', )
     filter_backends = [IngredientSearchFilter, ]
     search_fields = ('^name',)
 
-
-class TagViewSet(ReadViewSet):
+    def get_version_queryset(self):
+        """Результаты поиска берутся из индекса всего справочника,
+        поэтому версия списка - версия справочника"""
+        if self.action == 'list':
+            return Ingredient.objects.all()
+        return super().get_version_queryset()
+
+    def list(self, request, *args, **kwargs):
+        """Автодополнение по префиксу названия обслуживается
+        индексом в памяти без обращения к базе данных"""
+        name = request.query_params.get(IngredientSearchFilter.search_param)
+        if not name:
+            return super().list(request, *args, **kwargs)
+        limit = settings.INGREDIENT_SEARCH_LIMIT
+        try:
+            limit = min(int(request.query_params['limit']), limit)
+        except (KeyError, ValueError):
+            pass
+        return Response(ingredient_index.search(name, max(limit, 1)))
+
+
+class TagViewSet(CachedResponseMixin, ConditionalGetMixin, ReadViewSet):
     """Вьюсет модели Тэг"""
     serializer_class = TagSerializer
     queryset = Tag.objects.all()
     pagination_class = None
+    cache_generations = ('tags', )
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(CachedResponseMixin, ConditionalGetMixin,
+                    SerializerMetricsMixin, viewsets.ModelViewSet):
     """Вьюсет модели Рецепт"""
-    queryset = Recipe.objects.all()
     permission_classes = [IsAuthorOrReadOnly, ]
     filterset_class = RecipeFilterSet
     pagination_class = LimitPageNumberPagination
     filter_backends = [DjangoFilterBackend, ]
+    parser_classes = [JSONParser, MultiPartJSONParser, ]
+    cache_generations = ('recipes', )
+    cache_anonymous_only = True
+
+    def get_cache_generations(self):
+        """Порядок по популярности меняется с каждым
+        добавлением в избранное, а не только с рецептами"""
+        if 'ordering' in self.request.query_params:
+            return self.cache_generations + ('popularity', )
+        return self.cache_generations
+
+    def get_version(self):
+        """Порядок по популярности меняется без изменения рецептов,
+        для него условные запросы не поддерживаются. В штамп ответа
+        пользователю входят его флаги; у них нет времени изменения,
+        поэтому Last-Modified ему не отдается"""
+        if 'ordering' in self.request.query_params:
+            return None
+        version = super().get_version()
+        user = self.request.user
+        if version is None or not user.is_authenticated:
+            return version
+        parts, _ = version
+        return (*parts, user.id, *user_relations_version(user)), None
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        """Ответы и их ETag зависят от пользователя"""
+        patch_vary_headers(response, ('Authorization', ))
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def get_queryset(self):
+        """Список собирает RecipeListSerializer из кэша представлений,
+        странице нужны только id, автор, время изменения рецептов
+        и счетчик избранного для курсора при сортировке по нему"""
+        if self.action == 'list':
+            return Recipe.objects.only(
+                'id', 'author', 'updated_at', 'favorites_count'
+            )
+        return Recipe.objects.with_related().with_user_flags(
+            self.request.user
+        )
 
     def get_serializer_class(self):
         if self.request.method in ('GET', ):
@@ -50,6 +124,11 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+        change_counter(CustomUser, instance.author_id, 'recipes_count', -1)
+
 
 @api_view(['POST', 'DELETE', ])
 def favorite(request, recipe_id):
@@ -74,31 +153,20 @@ def shoping_cart(request, recipe_id):
 
 
 @api_view(['GET', ])
+@permission_classes((IsAuthenticated, ))
+@renderer_classes(SHOPPING_LIST_RENDERERS)
 def download_shoping_cart(request):
-    """Вью-функция для загрузки списка покупок"""
-    user = request.user
-    shopping_cart = ShoppingCart.objects.filter(user=user)
-    text_in_shopping_cart = ''
-    text_file = StringIO()
-    ingredients = AmountOfIngredient.objects.filter(
-        recipe__id__in=shopping_cart.values_list('recipe_id')
-    ).values(
-        'ingredient__name'
-    ).annotate(amount_of_ingredient=Sum('amount')).order_by('ingredient__name')
-
-    for item in ingredients:
-        ingredient_name = item['ingredient__name']
-        ingredient = get_object_or_404(Ingredient, name=ingredient_name)
-        measurement_unit = ingredient.measurement_unit
-        ingredient_amount = item['amount_of_ingredient']
-        text_in_shopping_cart += (f'{ingredient_name} ({measurement_unit}) - '
-                                  f'{ingredient_amount}\n')
-    text_file.write(text_in_shopping_cart)
-
-    input_file = text_file.getvalue()
-    response = HttpResponse(
-        input_file,
-        content_type='text/plain'
+    """Вью-функция для потоковой загрузки списка покупок.
+    Формат выбирается параметром format: txt, csv или pdf"""
+    renderer = request.accepted_renderer
+    content_type = renderer.media_type
+    if renderer.charset:
+        content_type = f'{content_type}; charset={renderer.charset}'
+    response = StreamingHttpResponse(
+        renderer.stream(get_shopping_list(request.user).iterator()),
+        content_type=content_type
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename=shoping_cart.{renderer.format}'
     )
-    response['Content-Disposition'] = 'attachment; filename=shoping_cart.txt'
     return response
@@ -1,18 +1,22 @@
 from rest_framework import mixins, viewsets
 
+from .middleware import SerializerMetricsMixin
 
-class ReadViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin,
-                  viewsets.GenericViewSet):
+
+class ReadViewSet(SerializerMetricsMixin, mixins.ListModelMixin,
+                  mixins.RetrieveModelMixin, viewsets.GenericViewSet):
     """Миксин чтения списка и опреденных объектов"""
     pass
 
 
-class ReadListViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+class ReadListViewSet(SerializerMetricsMixin, mixins.ListModelMixin,
+                      viewsets.GenericViewSet):
     """Миксин чтения списка объектов"""
     pass
 
 
-class CreateReadViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin,
-                        mixins.CreateModelMixin, viewsets.GenericViewSet):
+class CreateReadViewSet(SerializerMetricsMixin, mixins.ListModelMixin,
+                        mixins.RetrieveModelMixin, mixins.CreateModelMixin,
+                        viewsets.GenericViewSet):
     """Миксин создания объектов и чтения списка и опреденных объектов"""
     pass
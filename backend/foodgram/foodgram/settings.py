@@ -1,3 +1,5 @@
+import importlib
+import importlib.util
 import os
 
 from django.core.management.utils import get_random_secret_key
@@ -33,6 +35,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -78,6 +81,13 @@ DATABASES = {
     }
 }
 
+# Производитель СУБД берется у бэкенда, как connection.vendor:
+# PostgreSQL бывает и под другими ENGINE, например postgis
+if importlib.import_module(
+    f"{DATABASES['default']['ENGINE']}.base"
+).DatabaseWrapper.vendor == 'postgresql':
+    INSTALLED_APPS.append('django.contrib.postgres')
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -93,6 +103,38 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Алгоритм хэширования паролей: argon2 (нужен argon2-cffi) или pbkdf2.
+# Пароли с прежним алгоритмом или стоимостью пересчитываются при входе
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', default='argon2')
+
+if PASSWORD_HASHER == 'argon2' and importlib.util.find_spec('argon2') is None:
+    PASSWORD_HASHER = 'pbkdf2'
+
+PASSWORD_HASHERS = [
+    'users.hashers.Argon2PasswordHasher',
+    'users.hashers.PBKDF2PasswordHasher',
+]
+
+if PASSWORD_HASHER == 'pbkdf2':
+    PASSWORD_HASHERS.reverse()
+
+PASSWORD_PBKDF2_ITERATIONS = int(
+    os.getenv('PASSWORD_PBKDF2_ITERATIONS', default=150000)
+)
+
+PASSWORD_ARGON2_TIME_COST = int(
+    os.getenv('PASSWORD_ARGON2_TIME_COST', default=2)
+)
+
+# Память Argon2 в КиБ
+PASSWORD_ARGON2_MEMORY_COST = int(
+    os.getenv('PASSWORD_ARGON2_MEMORY_COST', default=512)
+)
+
+PASSWORD_ARGON2_PARALLELISM = int(
+    os.getenv('PASSWORD_ARGON2_PARALLELISM', default=2)
+)
+
 STATIC_URL = '/static/'
 
 STATIC_ROOT = os.path.join(BASE_DIR, "static")
@@ -111,7 +153,7 @@ AUTH_USER_MODEL = 'users.CustomUser'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -119,3 +161,101 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6,
 }
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    }
+}
+
+# Кэш ответов API в секундах, 0 - выключен. Поколения кэша
+# увеличиваются в процессе, который изменил данные, поэтому
+# при нескольких процессах нужен общий бэкенд (Redis, Memcached)
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', default=600))
+
+# Кэш общих представлений рецептов в секундах, 0 - выключен.
+# Ключ включает время изменения рецепта, поэтому срок может быть долгим
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', default=3600))
+
+# Кэш токенов: размер LRU процесса, срок его записей в секундах
+# и срок записей в общем кэше (0 - общий кэш не используется)
+TOKEN_CACHE_SIZE = 10000
+
+TOKEN_CACHE_LOCAL_TIMEOUT = 10
+
+TOKEN_CACHE_TIMEOUT = int(os.getenv('TOKEN_CACHE_TIMEOUT', default=0))
+
+INGREDIENT_SEARCH_LIMIT = 50
+
+SUBSCRIPTION_RECIPES_LIMIT = 3
+
+INGREDIENT_INDEX_TTL = 300
+
+INGREDIENT_FUZZY_SEARCH = True
+
+INGREDIENT_SIMILARITY_THRESHOLD = 0.3
+
+RECIPE_IMAGE_SIZES = {
+    'thumbnail': 200,
+    'card': 600,
+    'full': 1600,
+}
+
+RECIPE_IMAGE_FORMAT = 'WEBP'
+
+RECIPE_IMAGE_QUALITY = 80
+
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+
+RECIPE_IMAGE_ASYNC = True
+
+RECIPE_IMAGE_WORKERS = 2
+
+# Заголовок Server-Timing с метриками запроса, см. api.middleware
+SERVER_TIMING = DEBUG
+
+SLOW_QUERY_MS = 100
+
+QUERY_BUDGET_RAISE = False
+
+DEFAULT_QUERY_BUDGET = None
+
+QUERY_BUDGETS = {
+    'api:recipes-list': 13,
+    'POST api:recipes-list': 14,
+    'api:recipes-detail': 7,
+    'DELETE api:recipes-detail': 14,
+    'PATCH api:recipes-detail': 17,
+    'api:tags-list': 3,
+    'api:ingredients-list': 3,
+    'api:favorite': 9,
+    'api:shopping_cart': 9,
+    'api:download_shopping_cart': 2,
+    'users-list': 4,
+    'users-detail': 3,
+    'users-me': 2,
+    'subcriptions-list': 4,
+    'subscribe': 10,
+}
+
+# Метрики каждого запроса пишутся строкой JSON на уровне INFO;
+# REQUEST_METRICS_LOG_LEVEL=WARNING оставляет только превышения бюджета
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api.middleware': {
+            'handlers': ['console'],
+            'level': os.getenv('REQUEST_METRICS_LOG_LEVEL', default='INFO'),
+        },
+    },
+}
@@ -16,8 +16,17 @@ class RecipeTagInLine(admin.TabularInline):
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     inlines = (AmountOfIngredientInLine, RecipeTagInLine, )
-    list_display = ('name', 'author', )
+    list_display = ('name', 'author', 'favorites_count', )
     list_filter = ('author', 'tags__name', 'name', )
+    readonly_fields = (
+        'image_thumbnail', 'image_card', 'image_full', 'image_status',
+        'favorites_count', 'in_carts_count',
+    )
+
+    def save_model(self, request, obj, form, change):
+        if 'image' in form.changed_data:
+            obj.image_status = Recipe.IMAGE_PENDING
+        super().save_model(request, obj, form, change)
 
 
 @admin.register(Ingredient)
@@ -0,0 +1,57 @@
+"""Кэш справочных данных рецептов и поколения кэша ответов"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Tag
+
+TAG_MAP_CACHE_KEY = 'recipes:tag_slug_map'
+TAG_MAP_TIMEOUT = 60 * 60
+GENERATION_KEY = 'recipes:generation:{}'
+
+
+def get_tag_map():
+    """Словарь slug -> id всех тэгов из кэша"""
+    tag_map = cache.get(TAG_MAP_CACHE_KEY)
+    if tag_map is None:
+        tag_map = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(TAG_MAP_CACHE_KEY, tag_map, TAG_MAP_TIMEOUT)
+    return tag_map
+
+
+def get_tag_choices():
+    return [(slug, slug) for slug in get_tag_map()]
+
+
+def invalidate_tag_map():
+    cache.delete(TAG_MAP_CACHE_KEY)
+
+
+def get_generations(*names):
+    """Текущие номера поколений. Номер входит в ключ кэшированного
+    ответа, поэтому увеличение номера делает старые ответы
+    недоступными без перебора ключей. Пропавший из кэша номер
+    создается заново из текущего времени и не совпадает с прежним"""
+    keys = [GENERATION_KEY.format(name) for name in names]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, time.time_ns(), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def bump_generations(*names):
+    for name in names:
+        key = GENERATION_KEY.format(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def bump_generations_on_commit(*names):
+    """Увеличивает номера поколений после фиксации транзакции,
+    чтобы ответ, собранный до фиксации, не попал в новое поколение"""
+    transaction.on_commit(lambda: bump_generations(*names))
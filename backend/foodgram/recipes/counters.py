@@ -0,0 +1,57 @@
+"""Денормализованные счетчики рецептов и пользователей"""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from users.models import CustomUser, Subscription
+from .cache import bump_generations_on_commit
+from .models import Favorite, Recipe, ShoppingCart
+
+# (модель, поле счетчика, модель связи, поле связи с моделью)
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    (CustomUser, 'recipes_count', Recipe, 'author'),
+    (CustomUser, 'followers_count', Subscription, 'author'),
+)
+
+RECIPE_COUNTERS = {Favorite: 'favorites_count', ShoppingCart: 'in_carts_count'}
+
+
+def change_counter(model, pk, field, delta):
+    """Атомарно изменяет счетчик на delta выражением F(),
+    не опускаясь ниже нуля"""
+    if delta:
+        model.objects.filter(pk=pk).update(
+            **{field: Greatest(F(field) + delta, 0)}
+        )
+
+
+def actual_count(relation, relation_field):
+    """Подзапрос, считающий записи связи для строки внешнего запроса"""
+    return Coalesce(Subquery(
+        relation.objects.filter(**{relation_field: OuterRef('pk')}).order_by(
+        ).values(relation_field).annotate(count=Count('pk')).values('count')
+    ), 0)
+
+
+def reconcile_counters(batch_size=1000, dry_run=False):
+    """Находит строки, у которых счетчик разошелся с фактическим
+    числом записей, и исправляет их пакетными UPDATE. UPDATE
+    не отправляет сигналы, поэтому исправление счетчиков рецептов
+    делает устаревшими ответы с порядком по популярности.
+    Возвращает число исправленных строк для каждого счетчика"""
+    repaired = {}
+    for model, field, relation, relation_field in COUNTERS:
+        actual = actual_count(relation, relation_field)
+        drifted = list(model.objects.annotate(actual=actual).exclude(
+            **{field: F('actual')}
+        ).order_by('pk').values_list('pk', flat=True))
+        if not dry_run:
+            for start in range(0, len(drifted), batch_size):
+                model.objects.filter(
+                    pk__in=drifted[start:start + batch_size]
+                ).update(**{field: actual})
+        repaired[f'{model._meta.model_name}.{field}'] = len(drifted)
+        if drifted and not dry_run and model is Recipe:
+            bump_generations_on_commit('popularity')
+    return repaired
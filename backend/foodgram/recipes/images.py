@@ -0,0 +1,167 @@
+"""Фоновая обработка изображений рецептов"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from .cache import bump_generations_on_commit
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+
+def get_image_format():
+    """Формат уменьшенных копий: WebP, если Pillow
+    собран с его поддержкой, иначе JPEG"""
+    image_format = settings.RECIPE_IMAGE_FORMAT.upper()
+    if image_format == 'WEBP' and not features.check('webp'):
+        return 'JPEG'
+    return image_format
+
+
+def render_variant(image, width, image_format):
+    """Уменьшает изображение до ширины width с сохранением
+    пропорций и кодирует его в image_format"""
+    variant = image.copy()
+    variant.thumbnail((width, image.height), Image.LANCZOS)
+    buffer = io.BytesIO()
+    variant.save(
+        buffer,
+        format=image_format,
+        quality=settings.RECIPE_IMAGE_QUALITY
+    )
+    return ContentFile(buffer.getvalue())
+
+
+def open_image(file):
+    """Открывает и проверяет загруженное изображение,
+    приводя его к режиму, который поддерживает выходной формат"""
+    with Image.open(file) as image:
+        image.load()
+        image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ('RGBA', 'LA') or (
+        image.mode == 'P' and 'transparency' in image.info
+    )
+    if has_alpha and get_image_format() != 'JPEG':
+        return image.convert('RGBA')
+    return image.convert('RGB')
+
+
+def build_variants(recipe):
+    """Создает уменьшенные копии изображения рецепта и возвращает
+    значения полей модели: имена файлов и ширину оригинала"""
+    image_format = get_image_format()
+    extension = 'jpg' if image_format == 'JPEG' else image_format.lower()
+    with recipe.image.open('rb') as file:
+        image = open_image(file)
+    stem = os.path.splitext(os.path.basename(recipe.image.name))[0]
+    names = {'image_width': image.width}
+    for variant in Recipe.IMAGE_VARIANTS:
+        field = recipe._meta.get_field(f'image_{variant}')
+        content = render_variant(
+            image, settings.RECIPE_IMAGE_SIZES[variant], image_format
+        )
+        names[field.attname] = field.storage.save(
+            field.generate_filename(recipe, f'{stem}_{variant}.{extension}'),
+            content
+        )
+    return names
+
+
+def save_variants(recipe_id, image_name, fields):
+    """Записывает результат обработки, если изображение
+    рецепта не сменилось, пока шла обработка.
+    Файлы копий, которые больше не используются, удаляются"""
+    variant_fields = [
+        f'image_{variant}' for variant in Recipe.IMAGE_VARIANTS
+    ]
+    previous = Recipe.objects.filter(id=recipe_id).values_list(
+        *variant_fields
+    ).first() or ()
+    updated = Recipe.objects.filter(id=recipe_id, image=image_name).update(
+        updated_at=timezone.now(), **fields
+    )
+    if updated:
+        unused = [
+            name for field, name in zip(variant_fields, previous)
+            if name and fields.get(field, name) != name
+        ]
+    else:
+        unused = [fields[field] for field in variant_fields if field in fields]
+    storage = Recipe._meta.get_field(variant_fields[0]).storage
+    for name in unused:
+        storage.delete(name)
+    if updated:
+        bump_generations_on_commit('recipes')
+    return updated
+
+
+def process_recipe_image(recipe_id):
+    """Обрабатывает изображение рецепта и записывает копии в модель"""
+    recipe = Recipe.objects.filter(id=recipe_id).only('id', 'image').first()
+    if recipe is None or not recipe.image:
+        return
+    try:
+        names = build_variants(recipe)
+    except Exception:
+        logger.exception(
+            'Не удалось обработать изображение рецепта %s', recipe_id
+        )
+        save_variants(
+            recipe_id, recipe.image.name, {'image_status': Recipe.IMAGE_FAILED}
+        )
+        return
+    save_variants(
+        recipe_id,
+        recipe.image.name,
+        dict(names, image_status=Recipe.IMAGE_READY)
+    )
+
+
+class ImageWorker:
+    """Пул потоков, в котором обрабатываются изображения.
+    Создается при первой загрузке, чтобы не запускать потоки
+    в процессах, которые изображения не принимают"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=settings.RECIPE_IMAGE_WORKERS,
+                    thread_name_prefix='recipe-images'
+                )
+        return self._executor
+
+    @staticmethod
+    def run(recipe_id):
+        try:
+            process_recipe_image(recipe_id)
+        finally:
+            connection.close()
+
+    def submit(self, recipe_id):
+        return self.get_executor().submit(self.run, recipe_id)
+
+
+image_worker = ImageWorker()
+
+
+def schedule_image_processing(recipe_id):
+    """Ставит обработку изображения в очередь после фиксации
+    транзакции. При RECIPE_IMAGE_ASYNC = False изображение
+    обрабатывается сразу, в том же потоке"""
+    if settings.RECIPE_IMAGE_ASYNC:
+        transaction.on_commit(lambda: image_worker.submit(recipe_id))
+    else:
+        transaction.on_commit(lambda: process_recipe_image(recipe_id))
@@ -0,0 +1,121 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+import django
+from django.core.management import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+
+from recipes.images import build_variants, save_variants
+from recipes.models import Recipe
+
+
+def build_recipe_variants(recipe_id, image_name):
+    """Обрабатывает одно изображение в дочернем процессе.
+    База данных здесь не используется: результат
+    записывает родительский процесс"""
+    try:
+        return build_variants(Recipe(id=recipe_id, image=image_name)), None
+    except Exception as error:
+        return None, f'{type(error).__name__}: {error}'
+
+
+class Command(BaseCommand):
+    help = (
+        'Создает уменьшенные копии изображений рецептов, '
+        'у которых их еще нет, в нескольких процессах. В том числе '
+        'обрабатывает рецепты, оставшиеся в очереди после перезапуска '
+        'процесса: фоновая обработка сама их не возобновляет'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Количество процессов'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=16,
+            help='Количество изображений, передаваемых процессу за раз'
+        )
+        parser.add_argument(
+            '--pending-minutes',
+            type=int,
+            default=10,
+            help=(
+                'Рецепты в очереди обрабатываются, если они не менялись '
+                'столько минут: более новые еще обрабатывает сервер'
+            )
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересоздать копии у всех рецептов'
+        )
+
+    def handle(self, *args, **options):
+        if options['pending_minutes'] < 0:
+            raise CommandError('Число минут не может быть отрицательным')
+        if options['workers'] < 1 or options['chunk_size'] < 1:
+            raise CommandError(
+                'Количество процессов и размер пакета '
+                'должны быть положительными'
+            )
+        recipes = Recipe.objects.exclude(image='')
+        if not options['force']:
+            pending_before = timezone.now() - timedelta(
+                minutes=options['pending_minutes']
+            )
+            recipes = recipes.filter(
+                Q(image_status=Recipe.IMAGE_FAILED)
+                | Q(
+                    image_status=Recipe.IMAGE_PENDING,
+                    updated_at__lte=pending_before
+                )
+                | Q(image_status=Recipe.IMAGE_READY, image_width__isnull=True)
+            )
+        rows = list(recipes.order_by('id').values_list('id', 'image'))
+        if not rows:
+            self.stdout.write(self.style.SUCCESS('Все изображения обработаны'))
+            return
+
+        started = time.monotonic()
+        ready = failed = 0
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=options['workers'],
+            initializer=django.setup
+        ) as executor:
+            results = executor.map(
+                build_recipe_variants,
+                *zip(*rows),
+                chunksize=options['chunk_size']
+            )
+            for (recipe_id, image_name), (fields, error) in zip(
+                rows, results
+            ):
+                if error is None:
+                    ready += save_variants(
+                        recipe_id,
+                        image_name,
+                        dict(fields, image_status=Recipe.IMAGE_READY)
+                    )
+                    continue
+                failed += save_variants(
+                    recipe_id,
+                    image_name,
+                    {'image_status': Recipe.IMAGE_FAILED}
+                )
+                self.stderr.write(f'Рецепт {recipe_id}: {error}')
+        elapsed = time.monotonic() - started
+        rate = len(rows) / max(elapsed, 1e-6)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {ready}, с ошибками: {failed} '
+            f'за {elapsed:.2f} с ({rate:.1f} изображений/с)'
+        ))
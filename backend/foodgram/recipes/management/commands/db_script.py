@@ -1,38 +1,204 @@
 import csv
+import json
+import os
+import time
+from itertools import islice
 
 from django.conf import settings
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
 
-from recipes.models import Ingredient, Tag
+from recipes.cache import bump_generations, invalidate_tag_map
+from recipes.models import AmountOfIngredient, Ingredient, Recipe, Tag
+from recipes.search import ingredient_index
+
+DATA_DIR = os.path.join(settings.BASE_DIR, 'recipes', 'data')
+
+TAGS = (
+    ('Завтрак', '#0076FF', 'breakfast'),
+    ('Обед', '#FFCE26', 'lunch'),
+    ('Ужин', '#9922C8', 'dinner'),
+)
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            yield row[0], row[1]
+
+
+def read_json(file, chunk_size=64 * 1024):
+    """Читает массив объектов JSON по частям,
+    не загружая файл в память целиком"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    for chunk in iter(lambda: file.read(chunk_size), ''):
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and buffer[position:position + 1] == '[':
+                started = True
+                position += 1
+                continue
+            if buffer[position:position + 1] in ('', ']'):
+                break
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                break
+            yield item['name'], item['measurement_unit']
+        buffer = buffer[position:]
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
 
 
 class Command(BaseCommand):
+    help = (
+        'Загружает ингредиенты из CSV или JSON пакетами '
+        'и создает базовые тэги'
+    )
 
-    def handle(self, *args, **options):
-        with open(
-            f"{settings.BASE_DIR}/recipes/data/ingredients.csv",
-            "r",
-            encoding="utf-8",
-        ) as file:
-            file_reader = csv.reader(file)
-            for row in file_reader:
-                name, measurement_unit = row
-                Ingredient.objects.get_or_create(
-                    name=name,
-                    measurement_unit=measurement_unit)
-            file.close()
-
-        tags = (
-            ('Завтрак', '#0076FF', 'breakfast'),
-            ('Обед', '#FFCE26', 'lunch'),
-            ('Ужин', '#9922C8', 'dinner'),
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source',
+            default=os.path.join(DATA_DIR, 'ingredients.csv'),
+            help='Файл с ингредиентами (.csv или .json)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество строк в одном пакете'
+        )
+        parser.add_argument(
+            '--truncate',
+            action='store_true',
+            help=(
+                'Удалить все ингредиенты перед загрузкой '
+                '(вместе с их количеством в рецептах)'
+            )
+        )
+        parser.add_argument(
+            '--update-units',
+            action='store_true',
+            help=(
+                'Обновить единицу измерения у существующих ингредиентов, '
+                'если название однозначно и единица изменилась'
+            )
         )
 
-        for tag in tags:
-            name, color, slug = tag
-            Tag.objects.get_or_create(
-                name=name,
-                color=color,
-                slug=slug
+    def handle(self, *args, **options):
+        source = options['source']
+        reader = READERS.get(os.path.splitext(source)[1].lower())
+        if reader is None:
+            raise CommandError(f'Неизвестный формат файла: {source}')
+        if options['batch_size'] < 1:
+            raise CommandError('Размер пакета должен быть положительным')
+
+        started = time.monotonic()
+        with open(source, 'r', encoding='utf-8') as file:
+            with transaction.atomic():
+                if options['truncate']:
+                    self.truncate_ingredients()
+                total, created, updated = self.load_ingredients(
+                    reader(file),
+                    options['batch_size'],
+                    options['update_units']
+                )
+                Tag.objects.bulk_create(
+                    [
+                        Tag(name=name, color=color, slug=slug)
+                        for name, color, slug in TAGS
+                    ],
+                    ignore_conflicts=True
+                )
+        # bulk_create и bulk_update не отправляют сигналы,
+        # поэтому кэши сбрасываются здесь
+        ingredient_index.invalidate()
+        invalidate_tag_map()
+        bump_generations('recipes', 'tags', 'ingredients')
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Ингредиенты и тэги добавлены: обработано {total}, '
+            f'создано {created}, обновлено {updated} '
+            f'за {elapsed:.2f} с ({total / max(elapsed, 1e-6):.0f} строк/с)'
+        ))
+
+    @staticmethod
+    def truncate_ingredients():
+        """Удаляет ингредиенты и их количество в рецептах без сигналов:
+        delete() при подписчиках сигналов выбирает каждую строку
+        и отправляет по ней pre_delete и post_delete. Рецепты
+        отмечаются измененными одним запросом до удаления, пока связи
+        с ингредиентами еще есть; кэши сбрасываются после загрузки"""
+        Recipe.objects.filter(ingredients__isnull=False).touch()
+        AmountOfIngredient.objects.all()._raw_delete(connection.alias)
+        Ingredient.objects.all()._raw_delete(connection.alias)
+
+    def load_ingredients(self, rows, batch_size, update_units):
+        batch_size = min(batch_size, connection.ops.bulk_batch_size(
+            ['name', 'measurement_unit'], [None] * batch_size
+        ))
+        count_before = Ingredient.objects.count()
+        seen = set()
+        total = updated = 0
+        rows = iter(rows)
+        while True:
+            chunk = []
+            for name, measurement_unit in islice(rows, batch_size):
+                total += 1
+                key = (name.strip(), measurement_unit.strip())
+                if key not in seen:
+                    seen.add(key)
+                    chunk.append(key)
+            if not chunk:
+                break
+            if update_units:
+                chunk, changed = self.split_changed_units(chunk)
+                Ingredient.objects.bulk_update(
+                    changed, ['measurement_unit'], batch_size=batch_size
+                )
+                Recipe.objects.filter(ingredients__in=changed).touch()
+                updated += len(changed)
+            Ingredient.objects.bulk_create(
+                [
+                    Ingredient(name=name, measurement_unit=measurement_unit)
+                    for name, measurement_unit in chunk
+                ],
+                batch_size=batch_size,
+                ignore_conflicts=True
             )
-        self.stdout.write(self.style.SUCCESS('Ингредиенты и тэги добавлены'))
+        created = Ingredient.objects.count() - count_before
+        return total, created, updated
+
+    @staticmethod
+    def split_changed_units(chunk):
+        """Отделяет строки, у которых в базе есть единственный
+        ингредиент с тем же названием, но другой единицей измерения"""
+        units = {}
+        for name, measurement_unit in chunk:
+            units.setdefault(name, set()).add(measurement_unit)
+        existing = {}
+        for ingredient in Ingredient.objects.filter(name__in=units):
+            existing.setdefault(ingredient.name, []).append(ingredient)
+        changed = []
+        rest = []
+        for name, measurement_unit in chunk:
+            ingredients = existing.get(name, [])
+            if (
+                len(units[name]) == 1
+                and len(ingredients) == 1
+                and ingredients[0].measurement_unit != measurement_unit
+            ):
+                ingredients[0].measurement_unit = measurement_unit
+                changed.append(ingredients[0])
+            else:
+                rest.append((name, measurement_unit))
+        return rest, changed
@@ -0,0 +1,252 @@
+import random
+import time
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes.cache import bump_generations, invalidate_tag_map
+from recipes.counters import reconcile_counters
+from recipes.models import (AmountOfIngredient, Favorite, Ingredient, Recipe,
+                            RecipeTag, ShoppingCart, Tag)
+from recipes.search import ingredient_index
+from users.models import CustomUser, Subscription
+from .db_script import TAGS
+
+
+def parse_range(value):
+    """Диапазон вида '3:12' или одно число"""
+    low, _, high = value.partition(':')
+    try:
+        low = int(low)
+        high = int(high or low)
+    except ValueError:
+        raise CommandError(f'Некорректный диапазон: {value}')
+    if low < 0 or high < low:
+        raise CommandError(f'Некорректный диапазон: {value}')
+    return low, high
+
+
+def zipf_weights(count, skew):
+    """Накопленные веса, при которых i-й элемент выбирается
+    пропорционально 1 / (i + 1) ** skew: первые пользователи
+    и рецепты получают большую часть избранного и подписок"""
+    return list(accumulate(1 / (rank + 1) ** skew for rank in range(count)))
+
+
+def sample_pairs(rng, count, left, left_weights, right, right_weights,
+                 exclude_same=False):
+    """Уникальные пары (left, right) с учетом весов.
+    Количество пар ограничено числом возможных сочетаний"""
+    count = min(count, len(left) * len(right) - (
+        min(len(left), len(right)) if exclude_same else 0
+    ))
+    pairs = set()
+    attempts = 0
+    while len(pairs) < count and attempts < count * 20:
+        attempts += 1
+        pair = (
+            rng.choices(left, cum_weights=left_weights)[0],
+            rng.choices(right, cum_weights=right_weights)[0],
+        )
+        if not (exclude_same and pair[0] == pair[1]):
+            pairs.add(pair)
+    return pairs
+
+
+class Command(BaseCommand):
+    help = (
+        'Создает синтетический набор данных: пользователей, рецепты '
+        'с ингредиентами и тэгами, избранное, списки покупок и подписки. '
+        'Данные вставляются пакетами и воспроизводимы при одном --seed, '
+        'счетчики пересчитываются после вставки'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument(
+            '--ingredients',
+            type=int,
+            default=1000,
+            help='Сколько ингредиентов создать, если в базе их меньше'
+        )
+        parser.add_argument(
+            '--ingredients-per-recipe',
+            default='3:12',
+            help='Количество ингредиентов в рецепте, например 3:12'
+        )
+        parser.add_argument(
+            '--tags-per-recipe',
+            default='1:2',
+            help='Количество тэгов у рецепта, например 1:2'
+        )
+        parser.add_argument('--favorites', type=int, default=50000)
+        parser.add_argument('--cart-items', type=int, default=20000)
+        parser.add_argument('--subscriptions', type=int, default=20000)
+        parser.add_argument(
+            '--skew',
+            type=float,
+            default=1.0,
+            help=(
+                'Показатель распределения Ципфа для активности '
+                'пользователей и популярности рецептов, 0 - равномерно'
+            )
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--prefix',
+            default='synthetic',
+            help='Префикс имен и адресов создаваемых пользователей'
+        )
+        parser.add_argument(
+            '--password',
+            default='password',
+            help='Пароль всех создаваемых пользователей'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('Размер пакета должен быть положительным')
+        prefix = options['prefix']
+        if CustomUser.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix} уже есть, '
+                'укажите другой --prefix'
+            )
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.monotonic()
+        with transaction.atomic():
+            counts = self.generate(options)
+            reconcile_counters(batch_size=self.batch_size)
+        # bulk_create не отправляет сигналы, поэтому кэши сбрасываются здесь
+        ingredient_index.invalidate()
+        invalidate_tag_map()
+        bump_generations('recipes', 'tags', 'ingredients', 'popularity')
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            ', '.join(f'{name}: {count}' for name, count in counts.items())
+            + f' за {elapsed:.2f} с'
+        ))
+
+    def bulk_create(self, model, objects):
+        """bulk_create с размером пакета, который
+        поддерживает текущая база данных"""
+        fields = [field.name for field in model._meta.concrete_fields]
+        batch_size = min(self.batch_size, connection.ops.bulk_batch_size(
+            fields, [None] * self.batch_size
+        ))
+        model.objects.bulk_create(objects, batch_size=batch_size)
+
+    def generate(self, options):
+        rng = self.rng
+        prefix = options['prefix']
+        # Хэширование дорогое, поэтому у всех пользователей один хэш
+        password = make_password(options['password'])
+        self.bulk_create(CustomUser, [
+            CustomUser(
+                username=f'{prefix}{i}',
+                email=f'{prefix}{i}@foodgram.ru',
+                first_name='Имя',
+                last_name='Фамилия',
+                password=password
+            ) for i in range(options['users'])
+        ])
+        users = list(CustomUser.objects.filter(
+            username__startswith=prefix
+        ).order_by('id').values_list('id', flat=True))
+
+        Tag.objects.bulk_create(
+            [
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in TAGS
+            ],
+            ignore_conflicts=True
+        )
+        tags = list(Tag.objects.values_list('id', flat=True))
+        missing = options['ingredients'] - Ingredient.objects.count()
+        if missing > 0:
+            self.bulk_create(Ingredient, [
+                Ingredient(
+                    name=f'{prefix} ингредиент {i}',
+                    measurement_unit=rng.choice(('г', 'мл', 'шт.'))
+                ) for i in range(missing)
+            ])
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+
+        user_weights = zipf_weights(len(users), options['skew'])
+        recipe_ids_before = set(Recipe.objects.values_list('id', flat=True))
+        self.bulk_create(Recipe, [
+            Recipe(
+                author_id=rng.choices(users, cum_weights=user_weights)[0],
+                name=f'Рецепт {i}',
+                text='Описание рецепта',
+                cooking_time=rng.randint(1, 180),
+                image=f'recipes/images/{prefix}{i}.jpg',
+                image_thumbnail=f'recipes/images/variants/{prefix}{i}_t.webp',
+                image_card=f'recipes/images/variants/{prefix}{i}_c.webp',
+                image_full=f'recipes/images/variants/{prefix}{i}_f.webp',
+                image_width=1200,
+                image_status=Recipe.IMAGE_READY
+            ) for i in range(options['recipes'])
+        ])
+        recipes = [
+            pk for pk in Recipe.objects.order_by('id').values_list(
+                'id', flat=True
+            ) if pk not in recipe_ids_before
+        ]
+        low, high = parse_range(options['ingredients_per_recipe'])
+        self.bulk_create(AmountOfIngredient, [
+            AmountOfIngredient(
+                recipe_id=recipe,
+                ingredient_id=ingredient,
+                amount=rng.randint(1, 500)
+            )
+            for recipe in recipes
+            for ingredient in rng.sample(
+                ingredients, min(rng.randint(low, high), len(ingredients))
+            )
+        ])
+        low, high = parse_range(options['tags_per_recipe'])
+        self.bulk_create(RecipeTag, [
+            RecipeTag(recipe_id=recipe, tag_id=tag)
+            for recipe in recipes
+            for tag in rng.sample(tags, min(rng.randint(low, high), len(tags)))
+        ])
+
+        recipe_weights = zipf_weights(len(recipes), options['skew'])
+        favorites = sample_pairs(
+            rng, options['favorites'],
+            users, user_weights, recipes, recipe_weights
+        )
+        self.bulk_create(Favorite, [
+            Favorite(user_id=user, recipe_id=recipe)
+            for user, recipe in favorites
+        ])
+        cart = sample_pairs(
+            rng, options['cart_items'],
+            users, user_weights, recipes, recipe_weights
+        )
+        self.bulk_create(ShoppingCart, [
+            ShoppingCart(user_id=user, recipe_id=recipe)
+            for user, recipe in cart
+        ])
+        subscriptions = sample_pairs(
+            rng, options['subscriptions'],
+            users, user_weights, users, user_weights,
+            exclude_same=True
+        )
+        self.bulk_create(Subscription, [
+            Subscription(user_id=user, author_id=author)
+            for user, author in subscriptions
+        ])
+        return {
+            'пользователи': len(users),
+            'рецепты': len(recipes),
+            'избранное': len(favorites),
+            'списки покупок': len(cart),
+            'подписки': len(subscriptions),
+        }
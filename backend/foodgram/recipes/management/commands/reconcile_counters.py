@@ -0,0 +1,39 @@
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет счетчики избранного, списков покупок, рецептов '
+        'и подписчиков с фактическим числом записей и исправляет '
+        'расхождения пакетными UPDATE'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать число расхождений'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('Размер пакета должен быть положительным')
+        started = time.monotonic()
+        with transaction.atomic():
+            repaired = reconcile_counters(
+                batch_size=options['batch_size'],
+                dry_run=options['dry_run']
+            )
+        for counter, count in repaired.items():
+            self.stdout.write(f'{counter}: {count}')
+        action = 'Найдено' if options['dry_run'] else 'Исправлено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} расхождений: {sum(repaired.values())} '
+            f'за {time.monotonic() - started:.2f} с'
+        ))
@@ -0,0 +1,43 @@
+from django.db import DatabaseError, migrations, transaction
+
+INDEXES = (
+    ('recipes_ingredient_name_trgm', 'name gin_trgm_ops'),
+    ('recipes_ingredient_upper_name_trgm', 'UPPER(name::text) gin_trgm_ops'),
+)
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """Триграммные GIN-индексы по названию ингредиента.
+    Создаются только в PostgreSQL и только если расширение pg_trgm
+    удалось установить, на остальных базах поиск идет по индексу
+    в памяти процесса"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except DatabaseError:
+        return
+    for name, expression in INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} '
+            f'ON recipes_ingredient USING gin ({expression})'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _ in INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_auto_20220914_0835'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
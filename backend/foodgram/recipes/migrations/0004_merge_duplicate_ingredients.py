@@ -0,0 +1,52 @@
+from django.db import migrations
+from django.db.models import Count, F, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """Объединяет ингредиенты с одинаковыми названием и единицей
+    измерения перед добавлением ограничения уникальности. Если
+    в рецепте есть несколько дубликатов, их количество складывается"""
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    AmountOfIngredient = apps.get_model('recipes', 'AmountOfIngredient')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(
+        kept_id=Min('id'), count=Count('id')
+    ).order_by().filter(count__gt=1)
+    for duplicate in duplicates:
+        kept_id = duplicate['kept_id']
+        ids = Ingredient.objects.filter(
+            name=duplicate['name'],
+            measurement_unit=duplicate['measurement_unit']
+        ).values_list('id', flat=True)
+        kept_amounts = {}
+        for amount in AmountOfIngredient.objects.filter(
+            ingredient_id__in=ids
+        ).order_by('ingredient_id'):
+            if amount.recipe_id in kept_amounts:
+                AmountOfIngredient.objects.filter(
+                    id=kept_amounts[amount.recipe_id]
+                ).update(amount=F('amount') + amount.amount)
+                amount.delete()
+                continue
+            kept_amounts[amount.recipe_id] = amount.id
+            if amount.ingredient_id != kept_id:
+                amount.ingredient_id = kept_id
+                amount.save(update_fields=['ingredient'])
+        Ingredient.objects.filter(id__in=ids).exclude(id=kept_id).delete()
+
+
+class Migration(migrations.Migration):
+    """Отдельно от ограничения уникальности: в PostgreSQL изменение
+    таблицы ingredient в той же транзакции, что и правка связанных
+    строк, падает из-за отложенных проверок внешних ключей"""
+
+    dependencies = [
+        ('recipes', '0003_ingredient_name_trgm'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:19
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('recipes', 'Recipe', 'favorites_count', 'recipes', 'Favorite', 'recipe'),
+    (
+        'recipes', 'Recipe', 'in_carts_count',
+        'recipes', 'ShoppingCart', 'recipe'
+    ),
+    ('users', 'CustomUser', 'recipes_count', 'recipes', 'Recipe', 'author'),
+    (
+        'users', 'CustomUser', 'followers_count',
+        'users', 'Subscription', 'author'
+    ),
+)
+
+
+def fill_counters(apps, schema_editor):
+    """Заполняет новые счетчики фактическим числом записей"""
+    for app, model, field, relation_app, relation, relation_field in COUNTERS:
+        relation = apps.get_model(relation_app, relation)
+        apps.get_model(app, model).objects.update(**{field: Coalesce(
+            Subquery(
+                relation.objects.filter(
+                    **{relation_field: OuterRef('pk')}
+                ).order_by().values(relation_field).annotate(
+                    count=Count('pk')
+                ).values('count')
+            ),
+            0
+        )})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_image_width'),
+        ('users', '0003_customuser_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-id'], name='recipe_favorites_count_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,12 @@
 from colorfield.fields import ColorField
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+from django.utils import timezone
 
-from users.models import CustomUser
+from users.models import CustomUser, Subscription
 from .validators import cooking_time_validate
 
 User = get_user_model()
@@ -18,11 +22,29 @@ class Ingredient(models.Model):
         max_length=200,
         verbose_name='Единица измерения'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        db_index=True,
+        verbose_name='Изменен'
+    )
 
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['name'],
+                name='ingredient_name_pattern_idx',
+                opclasses=['varchar_pattern_ops']
+            )
+        ]
 
     def __str__(self):
         return self.name
@@ -53,6 +75,10 @@ class Tag(models.Model):
         unique=True,
         verbose_name='Слаг'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Изменен'
+    )
 
     class Meta:
         verbose_name = 'Тэг'
@@ -63,8 +89,96 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Набор запросов рецептов с заранее вычисленными
+    связями и флагами текущего пользователя"""
+
+    def with_related(self):
+        """Подгружает автора, тэги и ингредиенты
+        фиксированным числом запросов"""
+        return self.select_related('author').prefetch_related(
+            'tags',
+            models.Prefetch(
+                'amountofingredient',
+                queryset=AmountOfIngredient.objects.select_related(
+                    'ingredient'
+                )
+            )
+        )
+
+    def with_user_flags(self, user):
+        """Аннотирует is_favorited, is_in_shopping_cart
+        и author_is_subscribed подзапросами Exists()"""
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=models.Value(
+                    False, output_field=models.BooleanField()
+                ),
+                is_in_shopping_cart=models.Value(
+                    False, output_field=models.BooleanField()
+                ),
+                author_is_subscribed=models.Value(
+                    False, output_field=models.BooleanField()
+                ),
+            )
+        return self.annotate(
+            is_favorited=models.Exists(Favorite.objects.filter(
+                user=user,
+                recipe=models.OuterRef('pk')
+            )),
+            is_in_shopping_cart=models.Exists(ShoppingCart.objects.filter(
+                user=user,
+                recipe=models.OuterRef('pk')
+            )),
+            author_is_subscribed=models.Exists(Subscription.objects.filter(
+                user=user,
+                author=models.OuterRef('author')
+            )),
+        )
+
+    def touch(self):
+        """Обновляет updated_at без save(): представление рецепта
+        в API меняется вместе с его тэгами, ингредиентами и автором"""
+        return self.update(updated_at=timezone.now())
+
+    def latest_per_author(self, author_ids, limit=None):
+        """Последние limit рецептов каждого из авторов одним запросом.
+        Рецепты нумеруются оконной функцией ROW_NUMBER() в пределах
+        автора; Django 2.2 не умеет фильтровать по оконным выражениям,
+        поэтому нумерация вынесена в подзапрос. Условие записано
+        аннотацией: id__in=RawSQL(...) оборачивает подзапрос в двойные
+        скобки, и SQLite читает его как скалярный"""
+        recipes = self.filter(author_id__in=author_ids)
+        if limit is None:
+            return recipes
+        ranked = Recipe.objects.filter(author_id__in=author_ids).annotate(
+            recipe_rank=models.Window(
+                expression=RowNumber(),
+                partition_by=[models.F('author_id')],
+                order_by=models.F('id').desc()
+            )
+        ).order_by().values('id', 'recipe_rank')
+        sql, params = ranked.query.sql_with_params()
+        return recipes.annotate(is_latest=RawSQL(
+            f'{Recipe._meta.db_table}.id IN (SELECT id FROM ({sql}) ranked '
+            'WHERE recipe_rank <= %s)',
+            (*params, limit),
+            output_field=models.BooleanField()
+        )).filter(is_latest=True)
+
+
 class Recipe(models.Model):
     """Модель рецепта блюда"""
+    IMAGE_PENDING = 'pending'
+    IMAGE_READY = 'ready'
+    IMAGE_FAILED = 'failed'
+    IMAGE_STATUSES = (
+        (IMAGE_PENDING, 'Обрабатывается'),
+        (IMAGE_READY, 'Готово'),
+        (IMAGE_FAILED, 'Ошибка обработки'),
+    )
+    IMAGE_VARIANTS = ('thumbnail', 'card', 'full')
+
     ingredients = models.ManyToManyField(
         Ingredient,
         through='AmountOfIngredient',
@@ -80,6 +194,32 @@ class Recipe(models.Model):
         upload_to='recipes/images/',
         verbose_name='Изображение'
     )
+    image_thumbnail = models.ImageField(
+        upload_to='recipes/images/variants/',
+        blank=True,
+        verbose_name='Миниатюра изображения'
+    )
+    image_card = models.ImageField(
+        upload_to='recipes/images/variants/',
+        blank=True,
+        verbose_name='Изображение для карточки'
+    )
+    image_full = models.ImageField(
+        upload_to='recipes/images/variants/',
+        blank=True,
+        verbose_name='Изображение для страницы рецепта'
+    )
+    image_width = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name='Ширина изображения'
+    )
+    image_status = models.CharField(
+        max_length=10,
+        choices=IMAGE_STATUSES,
+        default=IMAGE_PENDING,
+        verbose_name='Статус обработки изображения'
+    )
     name = models.CharField(
         max_length=200,
         verbose_name='Название'
@@ -95,15 +235,83 @@ class Recipe(models.Model):
         verbose_name='Автор',
         on_delete=models.CASCADE
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Изменен'
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
+    saved_image = models.DEFERRED
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['id']
+        indexes = [
+            models.Index(
+                fields=['author', 'id'],
+                name='recipe_author_id_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-id'],
+                name='recipe_favorites_count_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Запоминает имя файла изображения в базе данных,
+        чтобы сохранение рецепта с прежним изображением
+        не запускало его обработку повторно"""
+        instance = super().from_db(db, field_names, values)
+        if 'image' in field_names:
+            instance.saved_image = values[field_names.index('image')]
+        return instance
+
+    def image_changed(self):
+        """Изображение сменилось с момента загрузки или прошлого
+        сохранения. Если изображение не загружалось из базы
+        данных, считается, что оно сменилось"""
+        return self.saved_image is models.DEFERRED or (
+            self.image.name != self.saved_image
+        )
+
+    def get_image(self, variant):
+        """Уменьшенная копия изображения, а пока
+        копии не готовы - исходное изображение"""
+        image = getattr(self, f'image_{variant}')
+        if self.image_status == self.IMAGE_READY and image:
+            return image
+        return self.image
+
+    def get_image_variants(self):
+        """Готовые копии изображения в виде
+        (название, файл, ширина в пикселях)"""
+        if self.image_status != self.IMAGE_READY or not self.image_width:
+            return []
+        return [
+            (
+                variant,
+                getattr(self, f'image_{variant}'),
+                min(settings.RECIPE_IMAGE_SIZES[variant], self.image_width)
+            )
+            for variant in self.IMAGE_VARIANTS
+        ]
+
 
 class Favorite(models.Model):
     """Модель избранного для пользователя"""
@@ -129,6 +337,12 @@ class Favorite(models.Model):
                 name='unique_recipe_for_user'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['user', 'recipe'],
+                name='favorite_user_recipe_idx'
+            )
+        ]
 
     def __str__(self):
         return f'{self.user} имеет {self.recipe} в избранном'
@@ -198,6 +412,12 @@ class RecipeTag(models.Model):
                 name='unique_tag_in_recipe'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['tag', 'recipe'],
+                name='recipetag_tag_recipe_idx'
+            )
+        ]
 
     def __str__(self):
         return f"""
@@ -231,6 +451,12 @@ class ShoppingCart(models.Model):
                 name='unique_recipe_in_users_shoping_cart'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['user', 'recipe'],
+                name='shoppingcart_user_recipe_idx'
+            )
+        ]
 
     def __str__(self):
         return f'''
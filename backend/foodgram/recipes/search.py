@@ -0,0 +1,195 @@
+"""Индекс ингредиентов в памяти процесса для автодополнения"""
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Lower, Replace
+
+from .models import Ingredient
+
+MAX_CHAR = chr(0x10FFFF)
+
+
+def normalize(value):
+    """Приводит строку к виду, в котором хранятся ключи индекса"""
+    return value.strip().casefold().replace('ё', 'е')
+
+
+def trigrams(value):
+    """Триграммы строки в том же виде, что и в pg_trgm:
+    каждое слово дополняется двумя пробелами слева и одним справа"""
+    grams = set()
+    for word in value.split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def pg_trgm_available():
+    """Проверяет, что база данных - PostgreSQL
+    с установленным расширением pg_trgm"""
+    if connection.vendor != 'postgresql':
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+            )
+            return cursor.fetchone() is not None
+    except DatabaseError:
+        return False
+
+
+class IngredientIndex:
+    """Отсортированный массив названий ингредиентов.
+    Поиск по префиксу выполняется бинарным поиском без
+    обращения к базе данных. Для нечеткого поиска рядом хранится
+    обратный индекс триграмм. Индекс строится при первом
+    запросе, сбрасывается при изменении ингредиентов и
+    перестраивается по истечении INGREDIENT_INDEX_TTL секунд,
+    чтобы подхватить изменения из других процессов"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+        self._use_pg_trgm = None
+
+    def invalidate(self):
+        with self._lock:
+            self._data = None
+
+    def build(self):
+        entries = sorted(
+            (normalize(name), name, pk, measurement_unit)
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            )
+        )
+        keys = [entry[0] for entry in entries]
+        rows = [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for _, name, pk, measurement_unit in entries
+        ]
+        postings = {}
+        sizes = []
+        for position, key in enumerate(keys):
+            grams = trigrams(key)
+            sizes.append(len(grams))
+            for gram in grams:
+                postings.setdefault(gram, []).append(position)
+        return keys, rows, postings, sizes, time.monotonic()
+
+    @staticmethod
+    def is_stale(data):
+        return data is None or (
+            time.monotonic() - data[-1] > settings.INGREDIENT_INDEX_TTL
+        )
+
+    def get_data(self):
+        data = self._data
+        if not self.is_stale(data):
+            return data
+        with self._lock:
+            if self.is_stale(self._data):
+                self._data = self.build()
+            return self._data
+
+    @property
+    def use_pg_trgm(self):
+        if self._use_pg_trgm is None:
+            self._use_pg_trgm = pg_trgm_available()
+        return self._use_pg_trgm
+
+    def search(self, query, limit):
+        """Возвращает не больше limit ингредиентов: сначала те,
+        название которых начинается с query (точное совпадение
+        первым, остальные по алфавиту), затем содержащие query,
+        затем похожие по триграммам в порядке убывания сходства"""
+        keys, rows, postings, sizes, _ = self.get_data()
+        prefix = normalize(query)
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + MAX_CHAR, lo=start)
+        found = rows[start:min(end, start + limit)]
+        if len(found) >= limit or not settings.INGREDIENT_FUZZY_SEARCH:
+            return found
+        if self.use_pg_trgm:
+            return found + self.search_pg_trgm(
+                query, limit - len(found), [row['id'] for row in found]
+            )
+        return found + [
+            rows[position] for position in self.search_trigrams(
+                prefix, limit - len(found), range(start, end),
+                keys, postings, sizes
+            )
+        ]
+
+    @staticmethod
+    def search_trigrams(prefix, limit, exclude, keys, postings, sizes):
+        """Нечеткий поиск по индексу триграмм в памяти.
+        Подстроки ищутся по самому короткому списку триграмм запроса,
+        сходство считается так же, как similarity() в pg_trgm"""
+        exclude = set(exclude)
+        query_grams = trigrams(prefix)
+        found = []
+        inner = [
+            postings.get(gram, ()) for gram in query_grams if ' ' not in gram
+        ]
+        if inner:
+            for position in min(inner, key=len):
+                if position not in exclude and prefix in keys[position]:
+                    found.append(position)
+                    if len(found) == limit:
+                        return found
+        exclude.update(found)
+        threshold = settings.INGREDIENT_SIMILARITY_THRESHOLD
+        required = threshold * len(query_grams) / (1 + threshold)
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(postings.get(gram, ()))
+        similar = []
+        for position, count in shared.most_common():
+            if count < required:
+                break
+            if position in exclude:
+                continue
+            similarity = count / (len(query_grams) + sizes[position] - count)
+            if similarity >= threshold:
+                similar.append((-similarity, keys[position], position))
+        similar.sort()
+        return found + [
+            position for *_, position in similar[:limit - len(found)]
+        ]
+
+    @staticmethod
+    def search_pg_trgm(query, limit, exclude):
+        """Нечеткий поиск средствами pg_trgm. Запрос и названия
+        нормализуются так же, как ключи индекса в памяти, порог
+        сходства - INGREDIENT_SIMILARITY_THRESHOLD"""
+        from django.contrib.postgres.search import TrigramSimilarity
+
+        query = normalize(query)
+        name = Replace(Lower('name'), Value('ё'), Value('е'))
+        return list(Ingredient.objects.exclude(
+            id__in=exclude
+        ).annotate(
+            normalized_name=name,
+            similarity=TrigramSimilarity(name, query)
+        ).filter(
+            Q(normalized_name__contains=query)
+            | Q(similarity__gte=settings.INGREDIENT_SIMILARITY_THRESHOLD)
+        ).annotate(
+            substring=Case(
+                When(normalized_name__contains=query, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField()
+            )
+        ).order_by(
+            'substring', '-similarity', 'name'
+        ).values('id', 'name', 'measurement_unit')[:limit])
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,86 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from users.models import CustomUser
+from .cache import bump_generations_on_commit, invalidate_tag_map
+from .images import schedule_image_processing
+from .models import AmountOfIngredient, Ingredient, Recipe, RecipeTag, Tag
+from .search import ingredient_index
+
+# Поколения кэша ответов, которые устаревают при изменении модели
+RESPONSE_GENERATIONS = {
+    Recipe: ('recipes', ),
+    AmountOfIngredient: ('recipes', ),
+    RecipeTag: ('recipes', ),
+    Tag: ('recipes', 'tags'),
+    Ingredient: ('recipes', 'ingredients'),
+}
+
+# Поля автора, которые показываются в рецептах
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    """Сбрасывает индекс автодополнения при изменении ингредиентов"""
+    ingredient_index.invalidate()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    """Сбрасывает кэш соответствия слагов и id тэгов"""
+    invalidate_tag_map()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def touch_tag_recipes(sender, instance, created=False, **kwargs):
+    """Отмечает измененными рецепты с изменившимся тэгом"""
+    if not created:
+        Recipe.objects.filter(tags=instance).touch()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def touch_ingredient_recipes(sender, instance, created=False, **kwargs):
+    """Отмечает измененными рецепты с изменившимся ингредиентом"""
+    if not created:
+        Recipe.objects.filter(ingredients=instance).touch()
+
+
+@receiver(post_save, sender=CustomUser)
+def touch_author_recipes(sender, instance, created, update_fields, **kwargs):
+    """Отмечает измененными рецепты автора и кэшированные ответы,
+    если изменились показываемые в рецептах данные. Сохранение
+    отдельных полей, например пароля при входе или last_login,
+    рецепты и кэш ответов не затрагивает"""
+    if created or update_fields and not AUTHOR_FIELDS & set(update_fields):
+        return
+    Recipe.objects.filter(author=instance).touch()
+    bump_generations_on_commit('recipes')
+
+
+@receiver(post_save, sender=Recipe)
+def process_image(sender, instance, **kwargs):
+    """Запускает обработку нового изображения рецепта. Повторные
+    сохранения с тем же изображением ее не запускают. Обработка,
+    прерванная перезапуском процесса, не возобновляется сама:
+    такие рецепты обрабатывает команда build_image_variants"""
+    if instance.image_status == Recipe.IMAGE_PENDING and (
+        instance.image_changed()
+    ):
+        schedule_image_processing(instance.id)
+    instance.saved_image = instance.image.name
+
+
+def invalidate_responses(sender, **kwargs):
+    """Делает устаревшими кэшированные ответы API,
+    в которые попадают данные изменившейся модели"""
+    bump_generations_on_commit(*RESPONSE_GENERATIONS[sender])
+
+
+for model in RESPONSE_GENERATIONS:
+    post_save.connect(invalidate_responses, sender=model)
+    post_delete.connect(invalidate_responses, sender=model)
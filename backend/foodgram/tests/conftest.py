@@ -0,0 +1,81 @@
+from io import StringIO
+
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.search import ingredient_index
+from users.authentication import token_cache
+from users.models import CustomUser
+
+
+def seed():
+    """Набор данных, близкий к рабочему: тысячи пользователей
+    и рецептов. Активность распределена неравномерно, поэтому
+    у первого пользователя - сотни избранных рецептов, рецептов
+    в списке покупок и подписок"""
+    call_command(
+        'generate_data',
+        users=2000,
+        recipes=3000,
+        ingredients=500,
+        ingredients_per_recipe='3:8',
+        favorites=20000,
+        cart_items=10000,
+        subscriptions=10000,
+        prefix='user',
+        seed=0,
+        stdout=StringIO()
+    )
+    Token.objects.create(user=CustomUser.objects.order_by('id').first())
+
+
+@pytest.fixture(scope='session')
+def django_db_setup(django_db_setup, django_db_blocker):
+    with django_db_blocker.unblock():
+        seed()
+
+
+@pytest.fixture(autouse=True)
+def query_budgets(settings):
+    """Бюджеты запросов из QUERY_BUDGETS проверяются в каждом тесте"""
+    settings.QUERY_BUDGET_RAISE = True
+    settings.RECIPE_IMAGE_ASYNC = False
+
+
+@pytest.fixture(autouse=True)
+def cold_caches():
+    """Каждый тест начинается с пустых кэшей,
+    чтобы число запросов не зависело от порядка тестов"""
+    cache.clear()
+    ingredient_index.invalidate()
+    token_cache.clear()
+
+
+@pytest.fixture
+def run_on_commit(monkeypatch):
+    """Тест выполняется в транзакции, которая не фиксируется,
+    поэтому колбэки on_commit вызываются сразу"""
+    monkeypatch.setattr(
+        transaction, 'on_commit', lambda func, using=None: func()
+    )
+
+
+@pytest.fixture
+def user(db):
+    return CustomUser.objects.order_by('id').first()
+
+
+@pytest.fixture
+def user_client(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {user.auth_token.key}')
+    return client
+
+
+@pytest.fixture
+def anon_client(db):
+    return APIClient()
@@ -0,0 +1,231 @@
+import time
+from http import HTTPStatus
+from io import StringIO
+
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.utils.http import http_date
+
+from recipes.models import Favorite, Ingredient, Recipe, Tag
+
+
+def test_recipe_list_cached(anon_client, django_assert_num_queries):
+    response = anon_client.get('/api/recipes/', {'limit': 6, 'tags': [
+        'lunch', 'breakfast'
+    ]})
+    assert response.status_code == HTTPStatus.OK
+    with django_assert_num_queries(0):
+        cached = anon_client.get('/api/recipes/', {'tags': [
+            'breakfast', 'lunch'
+        ], 'limit': 6})
+    assert cached.status_code == HTTPStatus.OK
+    assert cached.data == response.data
+
+
+def test_recipe_list_not_cached_for_user(
+    user_client, django_assert_max_num_queries
+):
+    user_client.get('/api/recipes/')
+    with django_assert_max_num_queries(8) as context:
+        user_client.get('/api/recipes/')
+    assert len(context.captured_queries) > 1
+
+
+def test_recipe_list_shared_for_user(
+    user_client, anon_client, django_assert_max_num_queries
+):
+    params = {'limit': 50}
+    anon_client.get('/api/recipes/', params)
+    with django_assert_max_num_queries(8) as context:
+        response = user_client.get('/api/recipes/', params)
+    assert response.status_code == HTTPStatus.OK
+    assert len(response.data['results']) == 50
+    assert not any(
+        'amountofingredient' in query['sql']
+        for query in context.captured_queries
+    )
+
+
+def test_recipe_list_user_flags_overlay(user, user_client, anon_client):
+    params = {'limit': 50}
+    recipes = anon_client.get('/api/recipes/', params).data['results']
+    Favorite.objects.get_or_create(user=user, recipe_id=recipes[0]['id'])
+    response = user_client.get('/api/recipes/', params)
+    assert response.data['results'][0]['is_favorited']
+    expected = {
+        recipe.id: recipe for recipe in Recipe.objects.with_user_flags(user)
+    }
+    for recipe in response.data['results']:
+        flags = expected[recipe['id']]
+        assert recipe['is_favorited'] == flags.is_favorited
+        assert recipe['is_in_shopping_cart'] == flags.is_in_shopping_cart
+        assert recipe['author']['is_subscribed'] == (
+            flags.author_is_subscribed
+        )
+
+
+def test_recipe_change_invalidates(
+    user, anon_client, django_assert_num_queries, run_on_commit
+):
+    recipe = Recipe.objects.filter(author=user).first()
+    params = {'author': user.id, 'limit': 50}
+    anon_client.get(f'/api/recipes/{recipe.id}/')
+    anon_client.get('/api/recipes/', params)
+    recipe.name = 'Новое название'
+    recipe.save()
+    response = anon_client.get(f'/api/recipes/{recipe.id}/')
+    assert response.data['name'] == 'Новое название'
+    response = anon_client.get('/api/recipes/', params)
+    assert 'Новое название' in [
+        recipe['name'] for recipe in response.data['results']
+    ]
+    with django_assert_num_queries(0):
+        anon_client.get(f'/api/recipes/{recipe.id}/')
+
+
+def test_popular_order_invalidated_by_favorite(
+    user, user_client, anon_client, run_on_commit
+):
+    params = {'ordering': '-favorites_count', 'limit': 1}
+    top = Recipe.objects.order_by('-favorites_count', '-id').first()
+    recipe = Recipe.objects.filter(id__gt=top.id).exclude(
+        favorite__user=user
+    ).order_by('id').first()
+    Recipe.objects.filter(id=recipe.id).update(
+        favorites_count=top.favorites_count - 1
+    )
+    response = anon_client.get('/api/recipes/', params)
+    assert response.data['results'][0]['id'] == top.id
+    response = user_client.post(f'/api/recipes/{recipe.id}/favorite/')
+    assert response.status_code == HTTPStatus.OK
+    response = anon_client.get('/api/recipes/', params)
+    assert response.data['results'][0]['id'] == recipe.id
+
+
+@pytest.mark.parametrize('url, model, field', (
+    ('/api/tags/', Tag, 'name'),
+    ('/api/ingredients/', Ingredient, 'measurement_unit'),
+))
+def test_catalogue_change_invalidates(
+    anon_client, django_assert_num_queries, run_on_commit, url, model, field
+):
+    anon_client.get(url)
+    with django_assert_num_queries(0):
+        anon_client.get(url)
+    obj = model.objects.order_by('id').first()
+    setattr(obj, field, 'изменено')
+    obj.save()
+    response = anon_client.get(url)
+    assert response.data[0][field] == 'изменено'
+
+
+def test_recipe_not_modified(anon_client, django_assert_num_queries):
+    recipe = Recipe.objects.order_by('id').first()
+    url = f'/api/recipes/{recipe.id}/'
+    response = anon_client.get(url)
+    assert response['ETag'].startswith('"')
+    assert response.has_header('Last-Modified')
+    with django_assert_num_queries(0):
+        cached = anon_client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+    assert cached.status_code == HTTPStatus.NOT_MODIFIED
+    assert cached['ETag'] == response['ETag']
+    cache.clear()
+    with django_assert_num_queries(1):
+        stamped = anon_client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+    assert stamped.status_code == HTTPStatus.NOT_MODIFIED
+
+
+@pytest.mark.parametrize('url, model', (
+    ('/api/recipes/', Recipe), ('/api/tags/', Tag),
+))
+def test_list_delete_not_hidden_by_if_modified_since(
+    anon_client, run_on_commit, url, model
+):
+    response = anon_client.get(url)
+    assert not response.has_header('Last-Modified')
+    model.objects.order_by('id').first().delete()
+    response = anon_client.get(
+        url, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 86400)
+    )
+    assert response.status_code == HTTPStatus.OK
+
+
+def test_recipe_list_etag_follows_user_flags(user, user_client):
+    params = {'limit': 6}
+    response = user_client.get('/api/recipes/', params)
+    assert not response.has_header('Last-Modified')
+    assert 'Authorization' in response['Vary']
+    etag = response['ETag']
+    not_modified = user_client.get(
+        '/api/recipes/', params, HTTP_IF_NONE_MATCH=etag
+    )
+    assert not_modified.status_code == HTTPStatus.NOT_MODIFIED
+    recipe = Recipe.objects.exclude(favorite__user=user).first()
+    user_client.post(f'/api/recipes/{recipe.id}/favorite/')
+    response = user_client.get(
+        '/api/recipes/', params, HTTP_IF_NONE_MATCH=etag
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert response['ETag'] != etag
+
+
+def test_tag_change_touches_recipes(anon_client, run_on_commit):
+    tag = Tag.objects.order_by('id').first()
+    recipe = Recipe.objects.filter(tags=tag).first()
+    url = f'/api/recipes/{recipe.id}/'
+    etag = anon_client.get(url)['ETag']
+    tag.name = 'Переименован'
+    tag.save()
+    response = anon_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == HTTPStatus.OK
+    assert response['ETag'] != etag
+
+
+def test_popular_order_has_no_etag(anon_client):
+    response = anon_client.get('/api/recipes/', {
+        'ordering': '-favorites_count'
+    })
+    assert response.status_code == HTTPStatus.OK
+    assert not response.has_header('ETag')
+
+
+def test_ingredient_import_invalidates(anon_client, tmp_path):
+    source = tmp_path / 'ingredients.csv'
+    source.write_text('импортированный ингредиент,г\n', encoding='utf-8')
+    count = len(anon_client.get('/api/ingredients/').data)
+    call_command('db_script', source=str(source), stdout=StringIO())
+    response = anon_client.get('/api/ingredients/')
+    assert len(response.data) == count + 1
+
+
+def test_ingredient_truncate_touches_recipes(
+    anon_client, tmp_path, django_assert_max_num_queries
+):
+    source = tmp_path / 'ingredients.csv'
+    source.write_text('импортированный ингредиент,г\n', encoding='utf-8')
+    recipe = Recipe.objects.filter(ingredients__isnull=False).first()
+    url = f'/api/recipes/{recipe.id}/'
+    etag = anon_client.get(url)['ETag']
+    with django_assert_max_num_queries(20):
+        call_command(
+            'db_script', source=str(source), truncate=True, stdout=StringIO()
+        )
+    assert list(Ingredient.objects.values_list('name', flat=True)) == [
+        'импортированный ингредиент'
+    ]
+    response = anon_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == HTTPStatus.OK
+    assert response.data['ingredients'] == []
+
+
+@pytest.mark.parametrize('url', (
+    '/api/recipes/999999/', '/api/recipes/abc/', '/api/tags/999999/',
+))
+def test_missing_object_not_modified_is_404(anon_client, user_client, url):
+    for client in (anon_client, user_client):
+        response = client.get(url, HTTP_IF_NONE_MATCH='*')
+        assert response.status_code == HTTPStatus.NOT_FOUND
+        assert not response.has_header('ETag')
@@ -0,0 +1,465 @@
+import base64
+import csv
+import json
+import logging
+from http import HTTPStatus
+from io import StringIO
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db.models import Count, F
+
+from recipes.cache import get_generations
+from recipes.models import (AmountOfIngredient, Favorite, Ingredient, Recipe,
+                            ShoppingCart, Tag)
+from users.models import CustomUser, Subscription
+
+PAGE_SIZES = (1, 6, 50)
+IMAGE = base64.b64encode(
+    b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01'
+    b'\x08\x06\x00\x00\x00\x1f\x15\xc4\x89\x00\x00\x00\rIDATx\x9cc\xf8\xff'
+    b'\xff?\x00\x05\xfe\x02\xfe\xa75\x81\x84\x00\x00\x00\x00IEND\xaeB`\x82'
+).decode()
+
+
+@pytest.fixture
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+
+
+def recipe_payload(ingredients):
+    return {
+        'ingredients': [
+            {'id': ingredient, 'amount': 10} for ingredient in ingredients
+        ],
+        'tags': list(Tag.objects.values_list('id', flat=True)),
+        'image': f'data:image/png;base64,{IMAGE}',
+        'name': 'Новый рецепт',
+        'text': 'Описание',
+        'cooking_time': 10,
+    }
+
+
+@pytest.mark.parametrize('limit', PAGE_SIZES)
+def test_recipe_list(user_client, django_assert_max_num_queries, limit):
+    with django_assert_max_num_queries(11):
+        response = user_client.get('/api/recipes/', {'limit': limit})
+    assert response.status_code == HTTPStatus.OK
+    assert len(response.data['results']) == limit
+
+
+@pytest.mark.parametrize('limit', PAGE_SIZES)
+def test_recipe_list_anonymous(
+    anon_client, django_assert_max_num_queries, limit
+):
+    with django_assert_max_num_queries(6):
+        response = anon_client.get('/api/recipes/', {'limit': limit})
+    assert response.status_code == HTTPStatus.OK
+    assert len(response.data['results']) == limit
+
+
+@pytest.mark.parametrize('limit', PAGE_SIZES)
+@pytest.mark.parametrize('params, max_queries', (
+    ({'tags': ['breakfast', 'dinner']}, 13),
+    ({'is_favorited': 1}, 11),
+    ({'is_favorited': 0}, 11),
+    ({'is_in_shopping_cart': 1}, 11),
+    ({'is_in_shopping_cart': 0}, 11),
+))
+def test_recipe_list_filters(
+    user_client, django_assert_max_num_queries, limit, params, max_queries
+):
+    with django_assert_max_num_queries(max_queries):
+        response = user_client.get(
+            '/api/recipes/', dict(params, limit=limit)
+        )
+    assert response.status_code == HTTPStatus.OK
+    assert len(response.data['results']) == limit
+
+
+def test_recipe_list_several_tags_no_duplicates(anon_client):
+    slugs = ['breakfast', 'lunch', 'dinner']
+    response = anon_client.get(
+        '/api/recipes/', {'tags': slugs, 'limit': 500}
+    )
+    ids = [recipe['id'] for recipe in response.data['results']]
+    assert len(ids) == len(set(ids))
+    expected = Recipe.objects.filter(tags__slug__in=slugs).distinct()
+    assert response.data['count'] == expected.count()
+    assert ids == list(
+        expected.order_by('id').values_list('id', flat=True)[:500]
+    )
+
+
+@pytest.mark.parametrize('limit', PAGE_SIZES)
+def test_recipe_list_author(user_client, django_assert_max_num_queries, limit):
+    author = Recipe.objects.values('author').annotate(
+        recipes=Count('id')
+    ).order_by('-recipes').first()
+    with django_assert_max_num_queries(13):
+        response = user_client.get(
+            '/api/recipes/', {'author': author['author'], 'limit': limit}
+        )
+    assert response.status_code == HTTPStatus.OK
+    assert len(response.data['results']) == min(limit, author['recipes'])
+
+
+def test_recipe_detail(user_client, django_assert_max_num_queries):
+    recipe = Recipe.objects.order_by('id').first()
+    with django_assert_max_num_queries(6):
+        response = user_client.get(f'/api/recipes/{recipe.id}/')
+    assert response.status_code == HTTPStatus.OK
+    assert response.data['image_srcset']
+
+
+@pytest.mark.parametrize('model, url, counter', (
+    (Favorite, 'favorite', 'favorites_count'),
+    (ShoppingCart, 'shopping_cart', 'in_carts_count'),
+))
+def test_toggle_recipe_relation(
+    user, user_client, django_assert_max_num_queries, model, url, counter
+):
+    recipe = Recipe.objects.exclude(
+        id__in=model.objects.filter(user=user).values('recipe_id')
+    ).order_by('id').first()
+    count = getattr(recipe, counter)
+    with django_assert_max_num_queries(9):
+        response = user_client.post(f'/api/recipes/{recipe.id}/{url}/')
+    assert response.status_code == HTTPStatus.OK
+    recipe.refresh_from_db()
+    assert getattr(recipe, counter) == count + 1
+    response = user_client.post(f'/api/recipes/{recipe.id}/{url}/')
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    with django_assert_max_num_queries(6):
+        response = user_client.delete(f'/api/recipes/{recipe.id}/{url}/')
+    assert response.status_code == HTTPStatus.OK
+    assert not model.objects.filter(user=user, recipe=recipe).exists()
+    recipe.refresh_from_db()
+    assert getattr(recipe, counter) == count
+
+
+def test_recipe_list_popular(anon_client, django_assert_max_num_queries):
+    with django_assert_max_num_queries(5):
+        response = anon_client.get(
+            '/api/recipes/', {'ordering': '-favorites_count', 'limit': 50}
+        )
+    assert response.status_code == HTTPStatus.OK
+    ids = [recipe['id'] for recipe in response.data['results']]
+    assert ids == list(Recipe.objects.order_by(
+        '-favorites_count', '-id'
+    ).values_list('id', flat=True)[:50])
+
+
+def walk_cursor(client, url, params):
+    """id из всех страниц курсорной пагинации по ссылкам next"""
+    response = client.get(url, {**params, 'pagination': 'cursor'})
+    ids = []
+    while True:
+        assert response.status_code == HTTPStatus.OK
+        ids += [item['id'] for item in response.data['results']]
+        if response.data['next'] is None:
+            return ids
+        response = client.get(response.data['next'])
+
+
+def test_recipe_list_cursor_walk(anon_client):
+    ids = walk_cursor(anon_client, '/api/recipes/', {'limit': 500})
+    assert ids == list(
+        Recipe.objects.order_by('id').values_list('id', flat=True)
+    )
+    page = anon_client.get('/api/recipes/', {'limit': 500})
+    assert [recipe['id'] for recipe in page.data['results']] == ids[:500]
+
+
+def test_recipe_list_popular_cursor(anon_client):
+    params = {'ordering': '-favorites_count', 'limit': 20}
+    response = anon_client.get(
+        '/api/recipes/', {**params, 'pagination': 'cursor'}
+    )
+    ids = [recipe['id'] for recipe in response.data['results']]
+    response = anon_client.get(response.data['next'])
+    ids += [recipe['id'] for recipe in response.data['results']]
+    assert ids == list(Recipe.objects.order_by(
+        '-favorites_count', '-id'
+    ).values_list('id', flat=True)[:40])
+
+
+@pytest.mark.parametrize('cart_size', (1, 100))
+def test_download_shopping_cart(
+    user, user_client, django_assert_max_num_queries, cart_size
+):
+    ShoppingCart.objects.filter(user=user).exclude(
+        id__in=ShoppingCart.objects.filter(
+            user=user
+        ).order_by('id').values('id')[:cart_size]
+    ).delete()
+    with django_assert_max_num_queries(2):
+        response = user_client.get('/api/recipes/download_shopping_cart/')
+        content = b''.join(response.streaming_content)
+    assert response.status_code == HTTPStatus.OK
+    assert content
+
+
+@pytest.mark.parametrize('format, media_type', (
+    ('txt', 'text/plain; charset=utf-8'),
+    ('csv', 'text/csv; charset=utf-8'),
+    ('pdf', 'application/pdf'),
+))
+def test_download_shopping_cart_content(user, user_client, format, media_type):
+    ShoppingCart.objects.filter(user=user).exclude(
+        id__in=ShoppingCart.objects.filter(
+            user=user
+        ).order_by('id').values('id')[:3]
+    ).delete()
+    expected = {}
+    for amount in AmountOfIngredient.objects.filter(
+        recipe__shoppingcart__user=user
+    ).select_related('ingredient'):
+        key = (amount.ingredient.name, amount.ingredient.measurement_unit)
+        expected[key] = expected.get(key, 0) + amount.amount
+    response = user_client.get(
+        '/api/recipes/download_shopping_cart/', {'format': format}
+    )
+    content = b''.join(response.streaming_content)
+    assert response.status_code == HTTPStatus.OK
+    assert response['Content-Type'] == media_type
+    assert response['Content-Disposition'].endswith(f'.{format}')
+    if format == 'pdf':
+        assert content.startswith(b'%PDF')
+        assert b'%%EOF' in content[-16:]
+        return
+    if format == 'txt':
+        lines = content.decode().splitlines()
+    else:
+        header, *rows = csv.reader(content.decode().splitlines())
+        assert header == ['Ингредиент', 'Единица измерения', 'Количество']
+        lines = [f'{name} ({unit}) - {amount}' for name, unit, amount in rows]
+    assert sorted(lines) == sorted(
+        f'{name} ({unit}) - {amount}'
+        for (name, unit), amount in expected.items()
+    )
+
+
+@pytest.mark.parametrize('format', ('txt', 'csv', 'pdf'))
+def test_download_shopping_cart_error_is_text(anon_client, format):
+    response = anon_client.get(
+        '/api/recipes/download_shopping_cart/', {'format': format}
+    )
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+    assert response['Content-Type'] == 'text/plain; charset=utf-8'
+    assert response.content.decode()
+
+
+@pytest.mark.parametrize('ingredients', (1, 10, 50))
+def test_recipe_create(
+    user, user_client, django_assert_max_num_queries, media_root, ingredients
+):
+    recipes_count = user.recipes_count
+    payload = recipe_payload(
+        Ingredient.objects.values_list('id', flat=True)[:ingredients]
+    )
+    with django_assert_max_num_queries(14):
+        response = user_client.post('/api/recipes/', payload, format='json')
+    assert response.status_code == HTTPStatus.CREATED
+    assert len(response.data['ingredients']) == ingredients
+    user.refresh_from_db()
+    assert user.recipes_count == recipes_count + 1
+    response = user_client.delete(f'/api/recipes/{response.data["id"]}/')
+    assert response.status_code == HTTPStatus.NO_CONTENT
+    user.refresh_from_db()
+    assert user.recipes_count == recipes_count
+
+
+def test_recipe_create_unknown_ingredient(user, user_client, media_root):
+    recipes_count = Recipe.objects.filter(author=user).count()
+    payload = recipe_payload([999999])
+    response = user_client.post('/api/recipes/', payload, format='json')
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert '999999' in str(response.data['ingredients'])
+    assert Recipe.objects.filter(author=user).count() == recipes_count
+
+
+def test_recipe_create_multipart(user_client, media_root):
+    payload = recipe_payload(Ingredient.objects.values_list(
+        'id', flat=True
+    )[:2])
+    del payload['image']
+    image = SimpleUploadedFile(
+        'recipe.png', base64.b64decode(IMAGE), content_type='image/png'
+    )
+    response = user_client.post(
+        '/api/recipes/',
+        {'data': json.dumps(payload), 'image': image},
+        format='multipart'
+    )
+    assert response.status_code == HTTPStatus.CREATED
+    assert len(response.data['ingredients']) == 2
+    assert Recipe.objects.get(id=response.data['id']).image.name.endswith(
+        '.png'
+    )
+
+
+@pytest.mark.parametrize('multipart', (False, True))
+def test_recipe_image_size_limit(settings, user_client, media_root, multipart):
+    settings.RECIPE_IMAGE_MAX_SIZE = 16
+    payload = recipe_payload(Ingredient.objects.values_list(
+        'id', flat=True
+    )[:1])
+    if multipart:
+        del payload['image']
+        image = SimpleUploadedFile(
+            'recipe.png', base64.b64decode(IMAGE), content_type='image/png'
+        )
+        response = user_client.post(
+            '/api/recipes/',
+            {'data': json.dumps(payload), 'image': image},
+            format='multipart'
+        )
+    else:
+        response = user_client.post('/api/recipes/', payload, format='json')
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert 'image' in response.data
+
+
+@pytest.mark.parametrize('ingredients', (1, 10, 50))
+def test_recipe_update(
+    user, user_client, django_assert_max_num_queries, media_root, ingredients
+):
+    recipe = Recipe.objects.create(
+        author=user,
+        name='Рецепт',
+        text='Описание',
+        cooking_time=1,
+        image='recipes/images/recipe.jpg'
+    )
+    payload = recipe_payload(
+        Ingredient.objects.values_list('id', flat=True)[:ingredients]
+    )
+    del payload['image']
+    with django_assert_max_num_queries(17):
+        response = user_client.patch(
+            f'/api/recipes/{recipe.id}/', payload, format='json'
+        )
+    assert response.status_code == HTTPStatus.OK
+    assert len(response.data['ingredients']) == ingredients
+
+
+def test_recipe_update_keeps_unchanged_rows(user, user_client):
+    recipe = Recipe.objects.filter(author=user).annotate(
+        ingredients_count=Count('amountofingredient')
+    ).filter(ingredients_count__gte=3).order_by('id').first()
+    kept, changed, removed = recipe.amountofingredient.order_by('id')[:3]
+    added = Ingredient.objects.exclude(recipe=recipe).first()
+    payload = {
+        'ingredients': [
+            {'id': kept.ingredient_id, 'amount': kept.amount},
+            {'id': changed.ingredient_id, 'amount': changed.amount + 1},
+            {'id': added.id, 'amount': 5},
+        ],
+        'tags': list(recipe.tags.values_list('id', flat=True)),
+    }
+    response = user_client.patch(
+        f'/api/recipes/{recipe.id}/', payload, format='json'
+    )
+    assert response.status_code == HTTPStatus.OK
+    amounts = {
+        amount.ingredient_id: amount
+        for amount in recipe.amountofingredient.all()
+    }
+    assert set(amounts) == {
+        kept.ingredient_id, changed.ingredient_id, added.id
+    }
+    assert amounts[kept.ingredient_id].id == kept.id
+    assert amounts[changed.ingredient_id].id == changed.id
+    assert amounts[changed.ingredient_id].amount == changed.amount + 1
+    assert not AmountOfIngredient.objects.filter(id=removed.id).exists()
+
+
+def test_recipe_partial_update(user, user_client):
+    recipe = Recipe.objects.filter(author=user).first()
+    tags = list(recipe.tags.values_list('id', flat=True))
+    amounts = list(recipe.amountofingredient.values_list(
+        'ingredient_id', 'amount'
+    ))
+    response = user_client.patch(
+        f'/api/recipes/{recipe.id}/', {'name': 'Новое название'},
+        format='json'
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert response.data['name'] == 'Новое название'
+    assert list(recipe.tags.values_list('id', flat=True)) == tags
+    assert list(recipe.amountofingredient.values_list(
+        'ingredient_id', 'amount'
+    )) == amounts
+
+
+def test_tag_list(user_client, django_assert_max_num_queries):
+    with django_assert_max_num_queries(3):
+        response = user_client.get('/api/tags/')
+    assert response.status_code == HTTPStatus.OK
+
+
+def test_ingredient_search(user_client, django_assert_max_num_queries):
+    with django_assert_max_num_queries(3):
+        response = user_client.get('/api/ingredients/', {'name': 'ингр'})
+    assert response.status_code == HTTPStatus.OK
+    assert response.data
+
+
+def test_image_processing_scheduled_on_change(db, monkeypatch):
+    scheduled = []
+    monkeypatch.setattr(
+        'recipes.signals.schedule_image_processing', scheduled.append
+    )
+    recipe = Recipe.objects.order_by('id').first()
+    recipe.image_status = Recipe.IMAGE_PENDING
+    recipe.save()
+    recipe.save()
+    assert scheduled == []
+    recipe.image = 'recipes/images/changed.jpg'
+    recipe.save()
+    recipe.save()
+    assert scheduled == [recipe.id]
+
+
+@pytest.mark.parametrize('server_timing', (False, True))
+def test_server_timing(settings, user_client, server_timing):
+    settings.SERVER_TIMING = server_timing
+    response = user_client.get('/api/recipes/', {'limit': 6})
+    assert response.status_code == HTTPStatus.OK
+    assert ('serializer;dur=' in response.get('Server-Timing', '')) is (
+        server_timing
+    )
+
+
+def test_request_metrics_logged(caplog, user_client):
+    with caplog.at_level(logging.INFO, logger='api.middleware'):
+        user_client.get('/api/recipes/', {'limit': 6})
+    metrics = json.loads(caplog.records[-1].getMessage())
+    assert metrics['view'] == 'api:recipes-list'
+    assert metrics['queries'] > 0
+
+
+def test_reconcile_counters(user, run_on_commit):
+    popularity = get_generations('popularity')
+    Recipe.objects.filter(id__in=Recipe.objects.order_by('id').values(
+        'id'
+    )[:10]).update(favorites_count=0, in_carts_count=100000)
+    CustomUser.objects.filter(id=user.id).update(
+        recipes_count=0, followers_count=0
+    )
+    call_command('reconcile_counters', batch_size=3, stdout=StringIO())
+    assert get_generations('popularity') != popularity
+    assert not Recipe.objects.annotate(
+        actual_favorites=Count('favorite', distinct=True),
+        actual_carts=Count('shoppingcart', distinct=True)
+    ).exclude(
+        favorites_count=F('actual_favorites'),
+        in_carts_count=F('actual_carts')
+    ).exists()
+    user.refresh_from_db()
+    assert user.recipes_count == Recipe.objects.filter(author=user).count()
+    assert user.followers_count == Subscription.objects.filter(
+        author=user
+    ).count()
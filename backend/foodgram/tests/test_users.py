@@ -0,0 +1,256 @@
+from http import HTTPStatus
+from io import StringIO
+
+import pytest
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.core.management import call_command
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Recipe
+from users.authentication import token_cache
+from users.models import CustomUser, Subscription
+
+PAGE_SIZES = (1, 6, 50)
+
+
+@pytest.mark.parametrize('limit', PAGE_SIZES)
+def test_user_list(user_client, django_assert_max_num_queries, limit):
+    with django_assert_max_num_queries(3):
+        response = user_client.get('/api/users/', {'limit': limit})
+    assert response.status_code == HTTPStatus.OK
+    assert len(response.data['results']) == limit
+
+
+def test_user_me(user_client, django_assert_max_num_queries):
+    with django_assert_max_num_queries(2):
+        response = user_client.get('/api/users/me/')
+    assert response.status_code == HTTPStatus.OK
+
+
+def test_user_detail(user_client, django_assert_max_num_queries):
+    with django_assert_max_num_queries(2):
+        response = user_client.get('/api/users/2/')
+    assert response.status_code == HTTPStatus.OK
+
+
+@pytest.mark.parametrize('limit', PAGE_SIZES)
+def test_subscription_list(user_client, django_assert_max_num_queries, limit):
+    with django_assert_max_num_queries(4):
+        response = user_client.get(
+            '/api/users/subscriptions/', {'limit': limit}
+        )
+    assert response.status_code == HTTPStatus.OK
+    assert len(response.data['results']) == limit
+
+
+def test_subscription_list_cursor_walk(user, user_client):
+    response = user_client.get(
+        '/api/users/subscriptions/', {'limit': 50, 'pagination': 'cursor'}
+    )
+    ids = []
+    while True:
+        ids += [author['id'] for author in response.data['results']]
+        if response.data['next'] is None:
+            break
+        response = user_client.get(response.data['next'])
+    assert ids == list(Subscription.objects.filter(user=user).order_by(
+        'id'
+    ).values_list('author_id', flat=True))
+    page = user_client.get('/api/users/subscriptions/', {'limit': 50})
+    assert [author['id'] for author in page.data['results']] == ids[:50]
+
+
+@pytest.mark.parametrize('recipes_limit', (0, 1, 5))
+def test_subscription_recipes_limit(user, user_client, recipes_limit):
+    response = user_client.get(
+        '/api/users/subscriptions/',
+        {'limit': 50, 'recipes_limit': recipes_limit}
+    )
+    assert response.status_code == HTTPStatus.OK
+    for author in response.data['results']:
+        recipes = Recipe.objects.filter(author_id=author['id'])
+        assert author['recipes_count'] == recipes.count()
+        assert [recipe['id'] for recipe in author['recipes']] == list(
+            recipes.order_by('-id').values_list('id', flat=True)[
+                :recipes_limit
+            ]
+        )
+
+
+def test_subscription_list_anonymous(anon_client):
+    response = anon_client.get('/api/users/subscriptions/')
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+def test_subscribe(user, user_client, django_assert_max_num_queries):
+    author = CustomUser.objects.exclude(id=user.id).exclude(
+        id__in=Subscription.objects.filter(user=user).values('author_id')
+    ).first()
+    followers_count = author.followers_count
+    with django_assert_max_num_queries(10):
+        response = user_client.post(f'/api/users/{author.id}/subscribe/')
+    assert response.status_code == HTTPStatus.OK
+    assert response.data['recipes_count'] == author.recipes_count
+    author.refresh_from_db()
+    assert author.followers_count == followers_count + 1
+    with django_assert_max_num_queries(6):
+        response = user_client.delete(f'/api/users/{author.id}/subscribe/')
+    assert response.status_code == HTTPStatus.OK
+    assert not Subscription.objects.filter(user=user, author=author).exists()
+    author.refresh_from_db()
+    assert author.followers_count == followers_count
+
+
+def test_token_cached(user_client, django_assert_num_queries):
+    user_client.get('/api/users/me/')
+    with django_assert_num_queries(1):
+        response = user_client.get('/api/users/me/')
+    assert response.status_code == HTTPStatus.OK
+
+
+def test_logout_revokes_cached_token(user_client, run_on_commit):
+    user_client.get('/api/users/me/')
+    response = user_client.post('/api/auth/token/logout/')
+    assert response.status_code == HTTPStatus.OK
+    response = user_client.get('/api/users/me/')
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+@pytest.mark.parametrize('timeout', (0, 60))
+def test_logout_during_cache_miss(
+    settings, user_client, run_on_commit, monkeypatch, timeout
+):
+    """Запрос прочитал токен из базы данных до выхода,
+    а сохраняет снимок в кэш уже после сброса"""
+    settings.TOKEN_CACHE_TIMEOUT = timeout
+    settings.QUERY_BUDGET_RAISE = False
+    authenticate = TokenAuthentication.authenticate_credentials
+
+    def authenticate_before_logout(self, key):
+        try:
+            return authenticate(self, key)
+        finally:
+            Token.objects.get(key=key).delete()
+
+    monkeypatch.setattr(
+        TokenAuthentication,
+        'authenticate_credentials',
+        authenticate_before_logout
+    )
+    response = user_client.get('/api/users/me/')
+    assert response.status_code == HTTPStatus.OK
+    monkeypatch.setattr(
+        TokenAuthentication, 'authenticate_credentials', authenticate
+    )
+    response = user_client.get('/api/users/me/')
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+    # Другой процесс: LRU пуст, снимок доступен только в общем кэше
+    token_cache.clear()
+    response = user_client.get('/api/users/me/')
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+def test_login_rotates_cached_token(user, user_client, run_on_commit):
+    user_client.get('/api/users/me/')
+    response = user_client.post('/api/auth/token/login/', {
+        'email': user.email, 'password': 'password'
+    })
+    assert response.status_code == HTTPStatus.OK
+    response = user_client.get('/api/users/me/')
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+def test_user_change_refreshes_cached_token(
+    user, user_client, run_on_commit
+):
+    user_client.get('/api/users/me/')
+    user.first_name = 'Изменено'
+    user.save()
+    response = user_client.get('/api/users/me/')
+    assert response.data['first_name'] == 'Изменено'
+
+
+def test_signup_hashes_password(anon_client):
+    response = anon_client.post('/api/users/', {
+        'username': 'new_user',
+        'email': 'new_user@foodgram.ru',
+        'first_name': 'Имя',
+        'last_name': 'Фамилия',
+        'password': 'Vj9#kLq2xZ',
+    })
+    assert response.status_code == HTTPStatus.CREATED
+    user = CustomUser.objects.get(username='new_user')
+    assert user.password != 'Vj9#kLq2xZ'
+    assert user.check_password('Vj9#kLq2xZ')
+
+
+@pytest.mark.parametrize('plaintext', ('plaintext', 'Summer2020$', 'abc$def'))
+def test_plaintext_password_hashed_on_login(user, anon_client, plaintext):
+    CustomUser.objects.filter(id=user.id).update(password=plaintext)
+    response = anon_client.post('/api/auth/token/login/', {
+        'email': user.email, 'password': 'wrong'
+    })
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    response = anon_client.post('/api/auth/token/login/', {
+        'email': user.email, 'password': plaintext
+    })
+    assert response.status_code == HTTPStatus.OK
+    user.refresh_from_db()
+    identify_hasher(user.password)
+    assert user.check_password(plaintext)
+
+
+def test_password_cost_upgraded_on_login(settings, user, anon_client):
+    settings.PASSWORD_HASHERS = ['users.hashers.PBKDF2PasswordHasher']
+    settings.PASSWORD_PBKDF2_ITERATIONS = 1000
+    CustomUser.objects.filter(id=user.id).update(
+        password=make_password('password')
+    )
+    settings.PASSWORD_PBKDF2_ITERATIONS = 2000
+    response = anon_client.post('/api/auth/token/login/', {
+        'email': user.email, 'password': 'password'
+    })
+    assert response.status_code == HTTPStatus.OK
+    user.refresh_from_db()
+    assert user.password.startswith('pbkdf2_sha256$2000$')
+
+
+def test_unknown_hash_is_not_plaintext(settings, user, anon_client):
+    settings.PASSWORD_HASHERS = ['users.hashers.PBKDF2PasswordHasher']
+    for encoded in ('argon2$argon2id$v=19$m=512,t=2,p=2$c2FsdA$aGFzaA',
+                    '098f6bcd4621d373cade4e832627b4f6'):
+        CustomUser.objects.filter(id=user.id).update(password=encoded)
+        response = anon_client.post('/api/auth/token/login/', {
+            'email': user.email, 'password': encoded
+        })
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+        user.refresh_from_db()
+        assert user.password == encoded
+
+
+def test_set_password(user, user_client):
+    response = user_client.post('/api/users/set_password/', {
+        'current_password': 'wrong', 'new_password': 'Vj9#kLq2xZ'
+    })
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    response = user_client.post('/api/users/set_password/', {
+        'current_password': 'password', 'new_password': 'Vj9#kLq2xZ'
+    })
+    assert response.status_code == HTTPStatus.OK
+    user.refresh_from_db()
+    identify_hasher(user.password)
+    assert user.check_password('Vj9#kLq2xZ')
+
+
+def test_hash_passwords_command(db):
+    users = list(CustomUser.objects.order_by('id')[:5])
+    for user in users:
+        CustomUser.objects.filter(id=user.id).update(
+            password=f'plain${user.id}'
+        )
+    call_command('hash_passwords', workers=2, batch_size=2, stdout=StringIO())
+    for user in users:
+        user.refresh_from_db()
+        identify_hasher(user.password)
+        assert user.check_password(f'plain${user.id}')
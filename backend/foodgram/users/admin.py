@@ -5,4 +5,12 @@ from .models import CustomUser
 
 @admin.register(CustomUser)
 class CustomUserAdmin(admin.ModelAdmin):
+    list_display = ('username', 'email', 'recipes_count', 'followers_count', )
     list_filter = ('email', 'username', )
+    readonly_fields = ('recipes_count', 'followers_count', )
+
+    def save_model(self, request, obj, form, change):
+        """Введенный в форме пароль сохраняется хэшем"""
+        if 'password' in form.changed_data:
+            obj.set_password(obj.password)
+        super().save_model(request, obj, form, change)
@@ -0,0 +1,135 @@
+"""Аутентификация по токену с кэшем токенов и пользователей"""
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+
+TOKEN_KEY = 'users:token:{}'
+GENERATION_KEY = 'users:token-generation:{}'
+
+
+class TokenCache:
+    """Снимки токенов вместе с пользователями. Первый уровень -
+    LRU в памяти процесса на TOKEN_CACHE_SIZE записей, второй -
+    общий кэш, если TOKEN_CACHE_TIMEOUT больше нуля. Сброс записи
+    в одном процессе не доходит до LRU остальных, поэтому записи
+    LRU живут TOKEN_CACHE_LOCAL_TIMEOUT секунд: столько отозванный
+    токен может оставаться действительным в других процессах.
+    Снимки хранятся сериализованными, и каждый запрос получает
+    собственный экземпляр пользователя.
+
+    Запрос, прочитавший токен из базы данных до его отзыва, может
+    сохранить снимок уже после сброса. Поэтому снимок сохраняется
+    с меткой, полученной до чтения из базы данных: в общем кэше -
+    с поколением токена, которое сброс заменяет, в LRU - с номером
+    сброса в процессе. Снимок с устаревшей меткой не используется"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._resets = 0
+
+    def get(self, key):
+        """Токен с подгруженным пользователем или None"""
+        snapshot = self.get_local(key)
+        if snapshot is None and settings.TOKEN_CACHE_TIMEOUT:
+            resets = self._resets
+            entries = cache.get_many(
+                [TOKEN_KEY.format(key), GENERATION_KEY.format(key)]
+            )
+            generation = entries.get(GENERATION_KEY.format(key))
+            stored_generation, stored = entries.get(
+                TOKEN_KEY.format(key), (None, None)
+            )
+            if generation is not None and stored_generation == generation:
+                snapshot = stored
+                self.set_local(key, snapshot, resets)
+        return None if snapshot is None else pickle.loads(snapshot)
+
+    def stamp(self, key):
+        """Метка для set; ее нужно получить до чтения токена
+        из базы данных"""
+        resets = self._resets
+        if not settings.TOKEN_CACHE_TIMEOUT:
+            return resets, None
+        generation_key = GENERATION_KEY.format(key)
+        generation = cache.get(generation_key)
+        if generation is None:
+            cache.add(
+                generation_key, uuid.uuid4().hex, settings.TOKEN_CACHE_TIMEOUT
+            )
+            generation = cache.get(generation_key)
+        return resets, generation
+
+    def set(self, token, stamp):
+        resets, generation = stamp
+        snapshot = pickle.dumps(token)
+        self.set_local(token.key, snapshot, resets)
+        if generation is not None:
+            cache.set(
+                TOKEN_KEY.format(token.key),
+                (generation, snapshot),
+                settings.TOKEN_CACHE_TIMEOUT
+            )
+
+    def delete(self, *keys):
+        with self._lock:
+            self._resets += 1
+            for key in keys:
+                self._entries.pop(key, None)
+        if keys and settings.TOKEN_CACHE_TIMEOUT:
+            cache.set_many(
+                {GENERATION_KEY.format(key): uuid.uuid4().hex for key in keys},
+                settings.TOKEN_CACHE_TIMEOUT
+            )
+
+    def clear(self):
+        """Очищает LRU процесса; записи общего кэша истекают сами"""
+        with self._lock:
+            self._resets += 1
+            self._entries.clear()
+
+    def get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, snapshot = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return snapshot
+
+    def set_local(self, key, snapshot, resets):
+        expires = time.monotonic() + settings.TOKEN_CACHE_LOCAL_TIMEOUT
+        with self._lock:
+            if resets != self._resets:
+                return
+            self._entries[key] = (expires, snapshot)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.TOKEN_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, который берет токен и пользователя
+    из token_cache и обращается к базе данных только при промахе.
+    Неактивные пользователи и неизвестные токены не кэшируются"""
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            stamp = token_cache.stamp(key)
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(token, stamp)
+            return user, token
+        return token.user, token
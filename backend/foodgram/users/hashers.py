@@ -0,0 +1,62 @@
+"""Хэширование паролей с настраиваемой стоимостью"""
+import re
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX, get_hashers
+
+# Несоленый MD5 без префикса, который Django тоже распознает
+UNSALTED_MD5 = re.compile(r'^[0-9a-f]{32}$')
+
+# Алгоритмы хэшеров, поставляемых с Django. Несоленые SHA1 и MD5
+# хранятся с префиксами sha1$$ и md5$$ и тоже попадают сюда
+SHIPPED_ALGORITHMS = frozenset(
+    hasher.algorithm for hasher in vars(hashers).values()
+    if isinstance(hasher, type)
+    and issubclass(hasher, hashers.BasePasswordHasher)
+    and hasher.algorithm
+)
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """PBKDF2 с числом итераций из PASSWORD_PBKDF2_ITERATIONS.
+    Хэши с другим числом итераций пересчитываются при входе"""
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_PBKDF2_ITERATIONS
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """Argon2 со стоимостью из настроек PASSWORD_ARGON2_*.
+    Хэши с другой стоимостью пересчитываются при входе"""
+
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2_PARALLELISM
+
+
+def is_password_hashed(encoded):
+    """Пароль сохранен хэшем или не задан. Хэш распознается
+    по префиксу <алгоритм>$, где алгоритм - один из хэшеров Django
+    или PASSWORD_HASHERS, а не только из настроек: хэш алгоритма,
+    исключенного из настроек, не должен стать паролем открытым
+    текстом, его проверка просто не проходит. Все остальное, в том
+    числе пароли вида 'Summer2020$', - пароль открытым текстом,
+    сохраненный до перехода на хэши"""
+    if not encoded or encoded.startswith(UNUSABLE_PASSWORD_PREFIX):
+        return True
+    algorithm, separator, _ = encoded.partition('$')
+    if not separator:
+        return UNSALTED_MD5.match(encoded) is not None
+    return algorithm in SHIPPED_ALGORITHMS or algorithm in {
+        hasher.algorithm for hasher in get_hashers()
+    }
@@ -0,0 +1,130 @@
+import importlib.util
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.management import BaseCommand, CommandError
+from django.test import Client, override_settings
+
+from api.management.commands.benchmark import git_commit, percentile
+
+# Настройка стоимости и значения по умолчанию для каждого алгоритма
+COSTS = {
+    'pbkdf2': (
+        'PASSWORD_PBKDF2_ITERATIONS', (100000, 150000, 260000, 390000)
+    ),
+    'argon2': ('PASSWORD_ARGON2_TIME_COST', (1, 2, 3, 4)),
+}
+
+HASHERS = {
+    'pbkdf2': 'users.hashers.PBKDF2PasswordHasher',
+    'argon2': 'users.hashers.Argon2PasswordHasher',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет время входа при разной стоимости хэширования пароля. '
+        'Проверка пароля занимает ядро процессора целиком, поэтому '
+        'одно ядро выдерживает около 1 / p50 входов в секунду'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hasher',
+            choices=COSTS,
+            default=settings.PASSWORD_HASHER
+        )
+        parser.add_argument(
+            '--costs',
+            nargs='+',
+            type=int,
+            help=(
+                'Число итераций PBKDF2 или time_cost Argon2, '
+                'по умолчанию - типичные значения'
+            )
+        )
+        parser.add_argument('--rounds', type=int, default=20)
+        parser.add_argument(
+            '--login',
+            metavar='EMAIL',
+            help=(
+                'Измерять вход этого пользователя через '
+                '/api/auth/token/login/, а не только проверку пароля. '
+                'Пароль пользователя будет пересчитан со стоимостью '
+                'последнего прогона, токен - заменен'
+            )
+        )
+        parser.add_argument('--password', default='password')
+        parser.add_argument('--output', help='Файл для сохранения результата')
+
+    def handle(self, *args, **options):
+        hasher = options['hasher']
+        if hasher == 'argon2' and importlib.util.find_spec('argon2') is None:
+            raise CommandError('Для argon2 нужен пакет argon2-cffi')
+        if options['rounds'] < 1:
+            raise CommandError('Количество повторов должно быть положительным')
+        setting, default_costs = COSTS[hasher]
+        hashers = [HASHERS[hasher]] + [
+            path for name, path in HASHERS.items() if name != hasher
+        ]
+        logging.getLogger('api.middleware').setLevel(logging.ERROR)
+        results = []
+        for cost in options['costs'] or default_costs:
+            overrides = {'PASSWORD_HASHERS': hashers, setting: cost}
+            with override_settings(**overrides):
+                timings = sorted(self.measure(options))
+            p50 = percentile(timings, 50)
+            results.append({
+                'cost': cost,
+                'p50_ms': round(p50 * 1000, 2),
+                'p95_ms': round(percentile(timings, 95) * 1000, 2),
+                'logins_per_core': round(1 / p50, 1),
+            })
+            self.stdout.write(
+                f'{setting}={cost:<8} p50 {results[-1]["p50_ms"]:>8.2f} мс  '
+                f'p95 {results[-1]["p95_ms"]:>8.2f} мс  '
+                f'{results[-1]["logins_per_core"]:>8.1f} входов/с на ядро'
+            )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump({
+                    'commit': git_commit(),
+                    'hasher': hasher,
+                    'mode': 'login' if options['login'] else 'check',
+                    'rounds': options['rounds'],
+                    'results': results,
+                }, file, ensure_ascii=False, indent=2)
+
+    def measure(self, options):
+        if options['login']:
+            run = self.login(options['login'], options['password'])
+        else:
+            encoded = make_password(options['password'])
+
+            def run():
+                return check_password(options['password'], encoded)
+        # Прогрев; при входе он же пересчитывает хэш пользователя
+        # с новой стоимостью
+        run()
+        timings = []
+        for _ in range(options['rounds']):
+            started = time.perf_counter()
+            if not run():
+                raise CommandError('Неверный пароль')
+            timings.append(time.perf_counter() - started)
+        return timings
+
+    @staticmethod
+    def login(email, password):
+        client = Client(HTTP_HOST='localhost')
+
+        def run():
+            return client.post(
+                '/api/auth/token/login/',
+                {'email': email, 'password': password},
+                content_type='application/json'
+            ).status_code == 200
+        return run
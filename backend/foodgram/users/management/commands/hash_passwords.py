@@ -0,0 +1,98 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+from operator import or_
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError
+from django.db.models import Case, F, Q, Value, When
+
+from users.hashers import is_password_hashed
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        'Хэширует пароли, сохраненные открытым текстом. Хэши считаются '
+        'в пуле процессов, по процессу на ядро. Пароль, измененный '
+        'пользователем во время работы команды, не перезаписывается'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Количество процессов, по умолчанию - число ядер'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать число паролей открытым текстом'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['workers'] < 1:
+            raise CommandError(
+                'Размер пакета и количество процессов '
+                'должны быть положительными'
+            )
+        started = time.monotonic()
+        plaintext = [
+            (pk, password) for pk, password in CustomUser.objects.order_by(
+                'pk'
+            ).values_list('pk', 'password').iterator()
+            if not is_password_hashed(password)
+        ]
+        if options['dry_run']:
+            action, count = 'Найдено', len(plaintext)
+        else:
+            action, count = 'Захэшировано', self.hash_passwords(
+                plaintext, options
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} паролей открытым текстом: {count} '
+            f'за {time.monotonic() - started:.2f} с'
+        ))
+
+    def hash_passwords(self, plaintext, options):
+        if not plaintext:
+            return 0
+        batch_size = options['batch_size']
+        workers = options['workers']
+        hashed = 0
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=django.setup
+        ) as pool:
+            for start in range(0, len(plaintext), batch_size):
+                batch = plaintext[start:start + batch_size]
+                hashes = pool.map(
+                    make_password,
+                    [password for _, password in batch],
+                    chunksize=max(1, len(batch) // (workers * 4))
+                )
+                hashed += self.save_batch(batch, hashes)
+                self.stdout.write(
+                    f'{min(start + batch_size, len(plaintext))} '
+                    f'из {len(plaintext)}'
+                )
+        return hashed
+
+    @staticmethod
+    def save_batch(batch, hashes):
+        """Один UPDATE на пакет. Хэш записывается, только если
+        в строке все еще тот же пароль открытым текстом"""
+        unchanged = [Q(pk=pk, password=password) for pk, password in batch]
+        return CustomUser.objects.filter(reduce(or_, unchanged)).update(
+            password=Case(
+                *(
+                    When(condition, then=Value(encoded))
+                    for condition, encoded in zip(unchanged, hashes)
+                ),
+                default=F('password')
+            )
+        )
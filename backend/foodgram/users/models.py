@@ -1,5 +1,8 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils.crypto import constant_time_compare
+
+from .hashers import is_password_hashed
 
 
 class CustomUser(AbstractUser):
@@ -29,6 +32,16 @@ class CustomUser(AbstractUser):
         max_length=150,
         verbose_name='Пароль'
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Рецептов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Подписчиков'
+    )
 
     class Meta:
         verbose_name = 'Пользователь'
@@ -38,6 +51,18 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return self.username
 
+    def check_password(self, raw_password):
+        """Пароль, сохраненный открытым текстом до перехода на хэши,
+        сверяется напрямую и при совпадении сразу хэшируется. Хэши
+        прежнего алгоритма или стоимости Django пересчитывает сам"""
+        if is_password_hashed(self.password):
+            return super().check_password(raw_password)
+        if not constant_time_compare(self.password, raw_password):
+            return False
+        self.set_password(raw_password)
+        self.save(update_fields=['password'])
+        return True
+
 
 class Subscription(models.Model):
     user = models.ForeignKey(
@@ -62,6 +87,12 @@ class Subscription(models.Model):
                 name='unique_subscription'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['user', 'author'],
+                name='subscription_user_author_idx'
+            )
+        ]
         ordering = ['id']
 
     def __str__(self):
@@ -1,6 +1,8 @@
 from django.contrib.auth import password_validation
 from rest_framework import serializers
 
+from api.fields import (RecipeImageField, RecipeImageSizesField,
+                        RecipeImageSrcsetField)
 from recipes.models import Recipe
 from .models import CustomUser, Subscription
 
@@ -10,6 +12,8 @@ class SubscribeMixin(serializers.Serializer):
     is_subscribed = serializers.SerializerMethodField()
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         author_id = obj.id if isinstance(obj, CustomUser) else obj.author.id
         user_id = self.context['request'].user.id if (
             isinstance(obj, CustomUser)
@@ -49,6 +53,9 @@ class SignUpSerializer(serializers.ModelSerializer):
         password_validation.validate_password(value)
         return value
 
+    def create(self, validated_data):
+        return CustomUser.objects.create_user(**validated_data)
+
     def to_representation(self, value):
         return CustomUserSerializer(
             value,
@@ -71,6 +78,9 @@ class ChangePasswordSerializer(serializers.Serializer):
 class RecipeInSubscriptionSerializer(serializers.ModelSerializer):
     """Сериализатор показа рецептов, выложенных
     авторами из подписок"""
+    image = RecipeImageField(variant='thumbnail')
+    image_sizes = RecipeImageSizesField()
+    image_srcset = RecipeImageSrcsetField()
 
     class Meta:
         model = Recipe
@@ -78,6 +88,8 @@ class RecipeInSubscriptionSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_sizes',
+            'image_srcset',
             'cooking_time'
         )
 
@@ -91,11 +103,8 @@ class SubscriptionSerializer(SubscribeMixin):
     first_name = serializers.ReadOnlyField(source='author.first_name')
     last_name = serializers.ReadOnlyField(source='author.last_name')
     recipes = RecipeInSubscriptionSerializer(
-        source='author.recipes',
+        source='author.latest_recipes',
         read_only=True,
         many=True
     )
-    recipes_count = serializers.SerializerMethodField()
-
-    def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.author.id).count()
+    recipes_count = serializers.ReadOnlyField(source='author.recipes_count')
@@ -0,0 +1,34 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache
+from .models import CustomUser
+
+
+def forget_tokens_on_commit(*keys):
+    """Сбрасывает снимки токенов после фиксации транзакции. Снимок,
+    который параллельный запрос прочитал до фиксации и сохранит
+    после сброса, отбрасывается по метке, см. TokenCache"""
+    if keys:
+        transaction.on_commit(lambda: token_cache.delete(*keys))
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def forget_token(sender, instance, **kwargs):
+    """Удаление или замена токена, в том числе в delete_token
+    и get_token, сразу делает недействительным его снимок"""
+    forget_tokens_on_commit(instance.key)
+
+
+@receiver(post_save, sender=CustomUser)
+def forget_user_tokens(sender, instance, created, **kwargs):
+    """Снимки токенов содержат пользователя, поэтому
+    после его изменения они собираются заново"""
+    if created:
+        return
+    forget_tokens_on_commit(*Token.objects.filter(
+        user=instance
+    ).values_list('key', flat=True))
@@ -1,3 +1,7 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (BooleanField, Exists, OuterRef, Prefetch, Value,
+                              prefetch_related_objects)
 from django.shortcuts import get_object_or_404
 from rest_framework import status
 from rest_framework.authtoken.models import Token
@@ -5,17 +9,64 @@ from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
+from api.pagination import LimitPageNumberPagination
 from api.viewsets import CreateReadViewSet, ReadListViewSet
+from recipes.counters import change_counter
+from recipes.models import Recipe
 from .models import CustomUser, Subscription
 from .serializers import (ChangePasswordSerializer, CustomUserSerializer,
                           SignUpSerializer, SubscriptionSerializer,
                           TokenSerializer)
 
 
+def get_recipes_limit(request):
+    """Количество рецептов автора в выдаче подписок из параметра
+    recipes_limit, без него - SUBSCRIPTION_RECIPES_LIMIT"""
+    try:
+        limit = int(request.query_params['recipes_limit'])
+    except (KeyError, ValueError):
+        return settings.SUBSCRIPTION_RECIPES_LIMIT
+    return max(limit, 0)
+
+
+def with_authors(subscriptions):
+    """Подгружает авторов подписок и аннотирует флаг
+    is_subscribed, который у подписки всегда истинен"""
+    return subscriptions.select_related('author').annotate(
+        is_subscribed=Value(True, output_field=BooleanField())
+    )
+
+
+def prefetch_latest_recipes(subscriptions, limit):
+    """Подгружает последние рецепты авторов страницы подписок
+    одним запросом в author.latest_recipes"""
+    authors = [subscription.author for subscription in subscriptions]
+    prefetch_related_objects(authors, Prefetch(
+        'recipes',
+        queryset=Recipe.objects.latest_per_author(
+            [author.id for author in authors], limit
+        ).order_by('-id'),
+        to_attr='latest_recipes'
+    ))
+
+
 class CustomUserViewSet(CreateReadViewSet):
     """Вьюсет данных пользователей"""
-    queryset = CustomUser.objects.all().order_by('id')
     permission_classes = (AllowAny, )
+    pagination_class = LimitPageNumberPagination
+
+    def get_queryset(self):
+        user = self.request.user
+        if not user.is_authenticated:
+            return CustomUser.objects.annotate(
+                is_subscribed=Value(False, output_field=BooleanField())
+            ).order_by('id')
+        return CustomUser.objects.annotate(
+            is_subscribed=Exists(Subscription.objects.filter(
+                user=user,
+                author=OuterRef('pk')
+            ))
+        ).order_by('id')
 
     def get_serializer_class(self):
         if self.request.method in ('POST', ):
@@ -40,9 +91,9 @@ class CustomUserViewSet(CreateReadViewSet):
         old_password = serializer.validated_data.get('current_password')
         new_password = serializer.validated_data.get('new_password')
         user = request.user
-        if user.password == old_password:
-            user.password = new_password
-            user.save()
+        if user.check_password(old_password):
+            user.set_password(new_password)
+            user.save(update_fields=['password'])
             return Response(
                 {"Пароль успешно изменен"},
                 status=status.HTTP_200_OK
@@ -56,10 +107,18 @@ class CustomUserViewSet(CreateReadViewSet):
 class SubscriptionViewSet(ReadListViewSet):
     """Вьюсет для подписок на авторов"""
     serializer_class = SubscriptionSerializer
+    pagination_class = LimitPageNumberPagination
+    permission_classes = (IsAuthenticated, )
 
     def get_queryset(self):
         user = self.request.user
-        return Subscription.objects.filter(user=user)
+        return with_authors(Subscription.objects.filter(user=user))
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            prefetch_latest_recipes(page, get_recipes_limit(self.request))
+        return page
 
     def retrieve(self, request, pk=None):
         return Response(
@@ -79,7 +138,7 @@ def get_token(request):
     password = serializer.validated_data.get('password')
     new_user = get_object_or_404(CustomUser, email=email)
 
-    if CustomUser.objects.filter(email=email, password=password).exists():
+    if new_user.check_password(password):
         if Token.objects.filter(user=new_user).exists():
             Token.objects.filter(user=new_user).delete()
         token = Token.objects.create(user=new_user)
@@ -101,6 +160,7 @@ def delete_token(request):
 
 
 @api_view(['POST', 'DELETE', ])
+@transaction.atomic
 def subscribe(request, user_id):
     """Вью-функция, отвечающая за подписку на авторов"""
     user = request.user
@@ -111,18 +171,26 @@ def subscribe(request, user_id):
                 {"Нельзя подписаться на себя"},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        elif Subscription.objects.filter(user=user, author=author).exists():
+        subscription, created = Subscription.objects.get_or_create(
+            user=user,
+            author=author
+        )
+        if not created:
             return Response(
                 {"Вы уже подписаны"},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        Subscription.objects.get_or_create(user=user, author=author)
+        change_counter(CustomUser, author.id, 'followers_count', 1)
+        subscription.is_subscribed = True
+        prefetch_latest_recipes([subscription], get_recipes_limit(request))
         serializer = SubscriptionSerializer(
-            get_object_or_404(Subscription, user=user, author=author)
+            subscription,
+            context={'request': request}
         )
         return Response(serializer.data, status=status.HTTP_200_OK)
-    if Subscription.objects.filter(user=user, author=author).exists():
-        Subscription.objects.filter(user=user, author=author).delete()
+    deleted, _ = Subscription.objects.filter(user=user, author=author).delete()
+    if deleted:
+        change_counter(CustomUser, author.id, 'followers_count', -deleted)
         return Response({"Успешная отписка"}, status=status.HTTP_200_OK)
     return Response(
         {"Вы не подписаны на данного пользователя"},